@@ -1,16 +1,29 @@
 import os
+import posixpath
 import uuid
 import subprocess
 import shutil
+import struct
 import tempfile
+import tarfile
+import zlib
+import zipfile
 from zipfile import ZipFile, ZIP_DEFLATED
-from io import BytesIO
-from flask import Flask, request, render_template, send_file, jsonify
+from io import BytesIO, StringIO
+from flask import Flask, Response, g, request, render_template, send_file, jsonify
 from werkzeug.utils import secure_filename
 import threading
+import abc
+import multiprocessing
+import multiprocessing.pool
+import heapq
+import itertools
 import json
+import csv
+import hashlib
 import re
 import time
+from collections import OrderedDict, deque
 
 try:
     from pdf2docx import Converter
@@ -19,17 +32,14 @@ except Exception:
     HAVE_PDF2DOCX = False
 
 try:
-    from pdfminer.high_level import extract_text
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
     HAVE_PDFMINER = True
 except Exception:
     HAVE_PDFMINER = False
 
-try:
-    import pandas as pd
-    HAVE_PANDAS = True
-except Exception:
-    HAVE_PANDAS = False
-
 try:
     from fpdf import FPDF
     HAVE_FPDF = True
@@ -49,15 +59,41 @@ except Exception:
     HAVE_DOCX2PDF = False
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageStat, features
     HAVE_PIL = True
+    HAVE_AVIF = features.check("avif")
 except Exception:
     HAVE_PIL = False
+    HAVE_AVIF = False
+
+try:
+    from reportlab.lib.pagesizes import A4, letter, landscape
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+    HAVE_REPORTLAB = True
+except Exception:
+    HAVE_REPORTLAB = False
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    HAVE_PYPDF = True
+except Exception:
+    HAVE_PYPDF = False
+
+try:
+    import zstandard
+    HAVE_ZSTD = True
+except Exception:
+    HAVE_ZSTD = False
 
 # -------------------------
 # FFmpeg PATH (IMPORTANT)
 # -------------------------
 FFMPEG_PATH = r"C:\ffmpeg-8.0-full_build\bin\ffmpeg.exe"  
+# ffprobe ships next to ffmpeg in every build
+FFPROBE_PATH = re.sub(r"ffmpeg(\.exe)?$", r"ffprobe\1", FFMPEG_PATH)
 
 # -------------------------
 # APP SETUP
@@ -72,7 +108,6 @@ PROGRESS_FOLDER = os.path.join(BASE_DIR, "progress")
 # Create folders
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROGRESS_FOLDER, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'xlsx', 'txt', 'pptx', 'ppt', 'csv', 'xls', 'mp4', 'mkv', 'mov', 'jpg', 'jpeg', 'png', 'zip'}
 
@@ -94,329 +129,2578 @@ def converted_filename(original, new_ext):
     base, _ = os.path.splitext(secure_filename(original))
     return f"{base}_converted{new_ext}"
 
-def _secs_from_hms(h, m, s):
-    return int(h) * 3600 + int(m) * 60 + float(s)
+# -------------------------
+# Progress registry (in memory)
+# -------------------------
+PROGRESS_MIN_INTERVAL = 0.5   # seconds between "running" updates kept per job
+PROGRESS_TTL = 3600           # seconds a finished job stays queryable
+PROGRESS_PERSIST = False      # mirror state changes to PROGRESS_FOLDER for restart recovery
 
-def ffmpeg_monitor(input_abs, output_abs, job_id, ffmpeg_args):
+FINISHED_STATES = {"done", "failed", "error"}
+
+class ProgressStore:
     """
-    Runs ffmpeg via subprocess.Popen and monitors stderr to extract progress info.
-    Writes updates to PROGRESS_FOLDER/{job_id}.json
+    Thread-safe job_id -> progress dict registry.
+    Updates that only change counters are throttled to min_interval; status
+    changes always go through. Finished jobs expire after ttl seconds.
     """
-    progress_path = os.path.join(PROGRESS_FOLDER, f"{job_id}.json")
-    with open(progress_path, "w", encoding="utf-8") as f:
-        json.dump({"status": "starting", "percent": 0, "frame": 0, "fps": 0, "bitrate": "", "speed": "", "time": "00:00:00", "eta": None}, f)
+    def __init__(self, min_interval, ttl, persist_dir=None):
+        self.min_interval = min_interval
+        self.ttl = ttl
+        self.persist_dir = persist_dir
+        self._cond = threading.Condition()
+        self._jobs = {}
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._recover()
+
+    def update(self, job_id, data, force=False):
+        """
+        Store data for job_id. Returns False if the update was throttled.
+        """
+        now = time.monotonic()
+        with self._cond:
+            entry = self._jobs.get(job_id)
+            changed = entry is None or entry["data"].get("status") != data.get("status")
+            if not force and not changed and now - entry["updated"] < self.min_interval:
+                return False
+            version = entry["version"] + 1 if entry else 1
+            finished = now if data.get("status") in FINISHED_STATES else None
+            self._jobs[job_id] = {"data": dict(data), "version": version, "updated": now, "finished": finished}
+            self._cond.notify_all()
+        if changed or force:
+            self._persist(job_id, data)
+        self._expire(now)
+        return True
 
-    probe_cmd = [FFMPEG_PATH, "-i", input_abs]
-    probe = subprocess.run(probe_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True).stderr
-    duration_match = re.search(r"Duration:\s*(\d+):(\d+):(\d+\.\d+)", probe)
-    total_seconds = None
-    if duration_match:
-        total_seconds = _secs_from_hms(duration_match.group(1), duration_match.group(2), duration_match.group(3))
+    def get(self, job_id):
+        with self._cond:
+            entry = self._jobs.get(job_id)
+            return dict(entry["data"]) if entry else None
+
+    def wait(self, job_id, version, timeout):
+        """
+        Block until job_id moves past version (or timeout).
+        Returns (data, version); data is None for unknown jobs.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._jobs.get(job_id, {}).get("version", 0) != version, timeout)
+            entry = self._jobs.get(job_id)
+            if not entry:
+                return None, 0
+            return dict(entry["data"]), entry["version"]
+
+    def _expire(self, now):
+        with self._cond:
+            stale = [j for j, e in self._jobs.items() if e["finished"] and now - e["finished"] > self.ttl]
+            for job_id in stale:
+                del self._jobs[job_id]
+        for job_id in stale:
+            self._persist(job_id, None)
+
+    def _persist(self, job_id, data):
+        if not self.persist_dir:
+            return
+        path = os.path.join(self.persist_dir, f"{job_id}.json")
+        try:
+            if data is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except Exception:
+            pass
+
+    def _recover(self):
+        now = time.monotonic()
+        for fname in os.listdir(self.persist_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.persist_dir, fname), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if data.get("status") not in FINISHED_STATES:
+                # The process that owned this job is gone
+                data = {"status": "error", "error": "interrupted by server restart"}
+            self._jobs[fname[:-5]] = {"data": data, "version": 1, "updated": now, "finished": now}
 
-    proc = subprocess.Popen(ffmpeg_args, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+progress_store = ProgressStore(PROGRESS_MIN_INTERVAL, PROGRESS_TTL,
+                               persist_dir=PROGRESS_FOLDER if PROGRESS_PERSIST else None)
 
-    time_re = re.compile(r"time=(\d+):(\d+):(\d+\.\d+)")
-    frame_re = re.compile(r"frame=\s*(\d+)")
-    fps_re = re.compile(r"fps=\s*([\d\.]+)")
-    bitrate_re = re.compile(r"bitrate=\s*([\d\.kKmMbB/]+)")
-    speed_re = re.compile(r"speed=\s*([\d\.x]+)")
+# -------------------------
+# Media probing (ffprobe)
+# -------------------------
+PROBE_CACHE_SIZE = 256
 
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+
+def probe_media(path):
+    """
+    Run `ffprobe -print_format json` once per file and cache the result,
+    keyed on path, size and mtime. Returns the parsed dict ({} on failure).
+    """
+    path = os.path.abspath(path)
     try:
-        while True:
-            line = proc.stderr.readline()
-            if not line:
-                if proc.poll() is not None:
-                    break
-                time.sleep(0.1)
+        st = os.stat(path)
+    except OSError:
+        return {}
+    key = (path, st.st_size, st.st_mtime_ns)
+
+    with _probe_lock:
+        if key in _probe_cache:
+            _probe_cache.move_to_end(key)
+            return _probe_cache[key]
+
+    cmd = [FFPROBE_PATH, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        info = json.loads(proc.stdout) if proc.returncode == 0 else {}
+    except Exception:
+        info = {}
+
+    with _probe_lock:
+        _probe_cache[key] = info
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return info
+
+def probe_duration(info):
+    """
+    Container duration in seconds, or None if unknown.
+    """
+    try:
+        return float(info["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def probe_bitrate_kbps(info):
+    """
+    Overall container bitrate in kb/s, or None if unknown.
+    """
+    try:
+        return int(info["format"]["bit_rate"]) // 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def probe_stream(info, codec_type):
+    """
+    First stream of the given codec_type ("video"/"audio"), or None.
+    """
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == codec_type:
+            return stream
+    return None
+
+def _fmt_hms(seconds):
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+def _drain_stderr(proc, tail):
+    for line in proc.stderr:
+        tail.append(line.rstrip())
+
+def _run_ffmpeg(ffmpeg_args, err_tail, on_progress, cancel=None):
+    """
+    Run one ffmpeg command with `-progress pipe:1` and call on_progress(block)
+    with each complete key=value progress block. Returns the exit code.
+    cancel: optional threading.Event; once it is set, ffmpeg is killed at its
+    next progress line.
+    """
+    cmd = [ffmpeg_args[0], "-progress", "pipe:1", "-nostats", "-v", "error"] + list(ffmpeg_args[1:])
+    proc = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+    # ffmpeg only prints errors now; keep the last few for the failure message
+    err_thread = threading.Thread(target=_drain_stderr, args=(proc, err_tail), daemon=True)
+    err_thread.start()
+
+    try:
+        block = {}
+        for line in proc.stdout:
+            if cancel is not None and cancel.is_set():
+                proc.kill()
+                break
+            key, sep, value = line.strip().partition("=")
+            if not sep:
                 continue
+            block[key] = value.strip()
+            if key == "progress":
+                on_progress(block)
+                block = {}
+    finally:
+        proc.wait()
+        err_thread.join(timeout=1)
+    return proc.returncode
 
-            tm = time_re.search(line)
-            fr = frame_re.search(line)
-            fps = fps_re.search(line)
-            br = bitrate_re.search(line)
-            sp = speed_re.search(line)
-
-            current_seconds = None
-            percent = 0.0
-            time_str = None
-            if tm:
-                h, m, s = tm.groups()
-                current_seconds = _secs_from_hms(h, m, s)
-                time_str = f"{int(h):02d}:{int(m):02d}:{float(s):06.3f}"
-                if total_seconds and total_seconds > 0:
-                    percent = min(100.0, (current_seconds / total_seconds) * 100.0)
-
-            status_obj = {
-                "status": "running",
-                "percent": round(percent, 2),
-                "frame": int(fr.group(1)) if fr else None,
-                "fps": float(fps.group(1)) if fps else None,
-                "bitrate": br.group(1) if br else "",
-                "speed": sp.group(1) if sp else "",
-                "time": time_str if time_str else "",
-                "eta_seconds": None
-            }
+def _progress_seconds(block):
+    try:
+        return int(block.get("out_time_us", "")) / 1_000_000
+    except ValueError:
+        return None
 
-            if percent > 0 and current_seconds:
-                try:
-                    remaining = (100.0 - percent) * (current_seconds / percent)
-                    status_obj["eta_seconds"] = int(remaining)
-                except Exception:
-                    status_obj["eta_seconds"] = None
+def _run_ffmpeg_pass(ffmpeg_args, job_id, total_seconds, index, count, err_tail):
+    """
+    Run one ffmpeg command, publishing its progress as pass index of count.
+    Returns (returncode, last frame number).
+    """
+    last = {"frame": None}
 
-            with open(progress_path, "w", encoding="utf-8") as f:
-                json.dump(status_obj, f)
+    def publish(block):
+        current_seconds = _progress_seconds(block)
+        percent = 0.0
+        if current_seconds is not None and total_seconds:
+            percent = min(100.0, max(0.0, (current_seconds / total_seconds) * 100.0))
 
+        try:
+            speed = float(block.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = None
+
+        if block.get("frame", "").isdigit():
+            last["frame"] = int(block["frame"])
+        status_obj = {
+            "status": "running",
+            "percent": round((index * 100.0 + percent) / count, 2),
+            "frame": last["frame"],
+            "fps": float(block["fps"]) if block.get("fps") else None,
+            "bitrate": block.get("bitrate", "") if block.get("bitrate") != "N/A" else "",
+            "speed": block.get("speed", "") if block.get("speed") != "N/A" else "",
+            "time": _fmt_hms(current_seconds) if current_seconds is not None else "",
+            "eta_seconds": None
+        }
+        if count > 1:
+            status_obj["pass"] = index + 1
+            status_obj["passes"] = count
+
+        # Remaining media time (this pass and any after it) divided by
+        # encode speed gives wall-clock ETA
+        if total_seconds and current_seconds and speed:
+            remaining = max(0.0, total_seconds - current_seconds) + (count - index - 1) * total_seconds
+            status_obj["eta_seconds"] = int(remaining / speed)
+
+        progress_store.update(job_id, status_obj)
+
+    return _run_ffmpeg(ffmpeg_args, err_tail, publish), last["frame"]
+
+def _video_done_record(output_abs, elapsed, frames, total_seconds, details):
+    final_size = os.path.getsize(output_abs)
+    done_obj = {"status": "done", "percent": 100.0, "frame": None, "fps": None, "bitrate": "", "speed": "", "time": "", "eta_seconds": 0, "size": final_size, "output": output_abs,
+                "encode_seconds": round(elapsed, 2)}
+    if frames and elapsed:
+        done_obj["encode_fps"] = round(frames / elapsed, 2)
+    if total_seconds:
+        done_obj["bitrate_kbps"] = int(final_size * 8 / total_seconds / 1000)
+    done_obj.update(details or {})
+    return done_obj
+
+def ffmpeg_monitor(input_abs, output_abs, job_id, ffmpeg_args, cache_key=None, details=None, cleanup=None):
+    """
+    Runs ffmpeg via subprocess.Popen with `-progress pipe:1` and reads the
+    key=value progress blocks from stdout. ffmpeg_args is one command, or a
+    list of commands run in turn (the passes of a two-pass encode) with the
+    progress spread across them.
+    Publishes updates to progress_store under job_id; the done record carries
+    the achieved size, bitrate and encode fps plus details. A successful
+    output is registered in result_cache under cache_key when given, and the
+    cleanup directory (pass logs) is removed at the end.
+    """
+    progress_store.update(job_id, {"status": "starting", "percent": 0, "frame": 0, "fps": 0, "bitrate": "", "speed": "", "time": "00:00:00", "eta": None})
+
+    total_seconds = probe_duration(probe_media(input_abs))
+    passes = [ffmpeg_args] if isinstance(ffmpeg_args[0], str) else ffmpeg_args
+
+    err_tail = deque(maxlen=20)
+    started = time.monotonic()
+    returncode, frames = -1, None
+    try:
+        for index, args in enumerate(passes):
+            returncode, frames = _run_ffmpeg_pass(args, job_id, total_seconds, index, len(passes), err_tail)
+            if returncode != 0:
+                break
     except Exception as e:
-        with open(progress_path, "w", encoding="utf-8") as f:
-            json.dump({"status": "error", "error": str(e)}, f)
+        err_tail.append(str(e))
+        returncode = -1
     finally:
-        proc.wait()
-        if os.path.exists(output_abs):
-            final_size = os.path.getsize(output_abs)
-            done_obj = {"status": "done", "percent": 100.0, "frame": None, "fps": None, "bitrate": "", "speed": "", "time": "", "eta_seconds": 0, "size": final_size, "output": output_abs}
+        if cleanup:
+            shutil.rmtree(cleanup, ignore_errors=True)
+        if returncode == 0 and os.path.exists(output_abs):
+            done_obj = _video_done_record(output_abs, time.monotonic() - started, frames, total_seconds, details)
+            if cache_key:
+                result_cache.put(cache_key, output_abs)
         else:
-            done_obj = {"status": "failed", "error": "output file missing"}
-        with open(progress_path, "w", encoding="utf-8") as f:
-            json.dump(done_obj, f)
+            done_obj = {"status": "failed", "error": err_tail[-1] if err_tail else "output file missing"}
+        progress_store.update(job_id, done_obj, force=True)
+
+# -------------------------
+# Job scheduling (video encodes)
+# -------------------------
+# How many ffmpeg encodes may run at once; the rest wait in the queue.
+VIDEO_MAX_CONCURRENT = 2
+# Queue priorities: stream copies take seconds, so they go ahead of full encodes.
+VIDEO_PRIORITY_COPY = -1
+VIDEO_PRIORITY_ENCODE = 0
+
+class JobBackend(abc.ABC):
+    """
+    Interface for scheduler backends. submit() queues func(*args) under job_id;
+    lower priority numbers run first, equal priorities run in FIFO order.
+    """
+    @abc.abstractmethod
+    def submit(self, job_id, func, args=(), priority=0):
+        pass
+
+    @abc.abstractmethod
+    def position(self, job_id):
+        """
+        1-based position in the queue, 0 while running, None if unknown or finished.
+        """
+
+class InProcessBackend(JobBackend):
+    """
+    Default backend: a priority queue drained by a fixed number of daemon threads
+    inside this process. Threads are started lazily on first submit.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._cond = threading.Condition()
+        self._queue = []
+        self._running = set()
+        self._seq = itertools.count()
+        self._threads = []
+
+    def submit(self, job_id, func, args=(), priority=0):
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id, func, args))
+            while len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._worker, daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._cond.notify()
+
+    def position(self, job_id):
+        with self._cond:
+            if job_id in self._running:
+                return 0
+            for pos, entry in enumerate(sorted(self._queue), 1):
+                if entry[2] == job_id:
+                    return pos
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job_id, func, args = heapq.heappop(self._queue)
+                self._running.add(job_id)
+            try:
+                func(*args)
+            except Exception as e:
+                # Jobs publish their own failures; this catches what escapes them
+                app.logger.exception("Job %s failed", job_id)
+                progress_store.update(job_id, {"status": "error", "error": str(e)}, force=True)
+            finally:
+                with self._cond:
+                    self._running.discard(job_id)
+
+video_jobs = InProcessBackend(VIDEO_MAX_CONCURRENT)
+
+# -------------------------
+# Video rate control
+# -------------------------
+# x264 preset per speed budget; sources above VIDEO_HIGH_PIXEL_RATE (pixels per
+# second) step one preset faster so big files stay inside the same budget.
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+VIDEO_SPEED_PRESETS = {"fastest": "veryfast", "fast": "faster", "balanced": "medium", "quality": "slow"}
+VIDEO_HIGH_PIXEL_RATE = 1920 * 1080 * 30
+# Encoder threads per job: the cores shared between concurrent video jobs
+VIDEO_THREADS = max(1, (os.cpu_count() or 1) // VIDEO_MAX_CONCURRENT)
+VIDEO_AUDIO_KBPS = 64
+VIDEO_MIN_KBPS = 100
+VIDEO_MODES = ("vbr", "crf", "size")
+# Rough x264 bits per pixel per frame at CRF 23; doubles every 6 CRF steps
+VIDEO_CRF23_BPP = 0.08
+
+def _frame_rate(stream):
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        num, _, den = (stream.get(key) or "").partition("/")
+        try:
+            rate = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            continue
+        if rate > 0:
+            return rate
+    return None
+
+def _pixel_rate(info):
+    video = probe_stream(info, "video") or {}
+    try:
+        return int(video["width"]) * int(video["height"]) * (_frame_rate(video) or 30)
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+def x264_preset(speed, info):
+    """
+    x264 preset for a speed budget (key of VIDEO_SPEED_PRESETS), one step
+    faster for sources with a high pixel rate.
+    """
+    preset = VIDEO_SPEED_PRESETS.get(speed, "medium")
+    if _pixel_rate(info) > VIDEO_HIGH_PIXEL_RATE:
+        preset = X264_PRESETS[max(0, X264_PRESETS.index(preset) - 1)]
+    return preset
+
+def _crf(quality):
+    return round(35 - quality * 17 / 100)
+
+def video_target_kbps(info, mode="vbr", quality=70, target_mb=None):
+    """
+    Video bitrate (kb/s) the vbr and size modes aim for. For crf there is no
+    target, so this is a rough estimate from the source's pixel rate (None if
+    unknown). Raises ValueError when size mode has no duration to work with.
+    """
+    if mode == "crf":
+        bpp = VIDEO_CRF23_BPP * 2 ** ((23 - _crf(quality)) / 6)
+        return int(_pixel_rate(info) * bpp / 1000) or None
+    if mode == "size":
+        duration = probe_duration(info)
+        if not duration:
+            raise ValueError("Target size needs the video duration, which could not be read")
+        # Keep ~4% of the budget back for container overhead and ABR overshoot
+        return max(VIDEO_MIN_KBPS, int(target_mb * 8000 * 0.96 / duration) - VIDEO_AUDIO_KBPS)
+    source_kbps = probe_bitrate_kbps(info) or 2000
+    return max(int(source_kbps * (quality / 100)), 300)
+
+def build_video_passes(input_abs, output_abs, info, mode="vbr", quality=70, speed="balanced",
+                       target_mb=None, passlog=None, audio=True, threads=None):
+    """
+    ffmpeg commands for one video_compression job, and the settings chosen.
+    mode:
+    - "vbr": constrained VBR at quality% of the source bitrate (maxrate 1.5x)
+    - "crf": constant quality, quality 0-100 mapped to CRF 35-18
+    - "size": two-pass ABR aimed at target_mb megabytes; needs passlog
+    info is the probe of the whole source, so segment encodes (audio=False)
+    get the same rates as a single run.
+    """
+    preset = x264_preset(speed, info)
+    threads = threads or VIDEO_THREADS
+    head = [FFMPEG_PATH, "-i", input_abs]
+    video = ["-c:v", "libx264", "-preset", preset, "-threads", str(threads)]
+    audio = ["-c:a", "aac", "-b:a", f"{VIDEO_AUDIO_KBPS}k"] if audio else ["-an"]
+    tail = ["-movflags", "+faststart", "-y", output_abs]
+    details = {"mode": mode, "preset": preset, "threads": threads}
+
+    if mode == "crf":
+        crf = _crf(quality)
+        details["crf"] = crf
+        return [head + video + ["-crf", str(crf)] + audio + tail], details
+
+    kbps = video_target_kbps(info, mode, quality, target_mb)
+    if mode == "size":
+        details.update({"target_mb": target_mb, "video_kbps": kbps})
+        rate = ["-b:v", f"{kbps}k", "-passlogfile", passlog]
+        first = head + video + rate + ["-pass", "1", "-an", "-f", "null", "-y", os.devnull]
+        second = head + video + rate + ["-pass", "2"] + audio + tail
+        return [first, second], details
+
+    details["video_kbps"] = kbps
+    rate = ["-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.5)}k", "-bufsize", f"{kbps * 2}k"]
+    return [head + video + rate + audio + tail], details
+
+# -------------------------
+# Pre-flight analysis
+# -------------------------
+# Sources that are already H.264/HEVC at or below the bitrate a re-encode
+# would aim for keep their video stream; AAC audio up to VIDEO_AUDIO_COPY_KBPS
+# keeps its audio. Re-encoding those only burns CPU and loses quality, and
+# often gives a bigger file. In crf mode, which has no target of its own, video
+# below VIDEO_EFFICIENT_BPP is kept as well.
+VIDEO_COPY_CODECS = ("h264", "hevc")
+VIDEO_EFFICIENT_BPP = 0.05
+VIDEO_AUDIO_COPY_KBPS = 96
+VIDEO_PLANS = {"remux": "Remux only (stream copy)", "audio": "Re-encode audio only", "full": "Full re-encode"}
+
+def _stream_kbps(stream):
+    try:
+        return int(stream["bit_rate"]) // 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def plan_video(info, mode="vbr", quality=70, target_mb=None):
+    """
+    Decide from the probe data how much of the source to re-encode. Returns a
+    dict with action ("remux", "audio" or "full"), label, reason and, when the
+    probe has the numbers, the source and estimated output sizes in MB and the
+    estimated savings in percent.
+    """
+    video = probe_stream(info, "video")
+    audio = probe_stream(info, "audio")
+    duration = probe_duration(info)
+    target_kbps = video_target_kbps(info, mode, quality, target_mb)
+    if not video or not duration:
+        return {"action": "full", "label": VIDEO_PLANS["full"], "reason": "no stream details to compare against"}
+
+    audio_kbps = _stream_kbps(audio) if audio else 0
+    video_kbps = _stream_kbps(video)
+    if video_kbps is None and probe_bitrate_kbps(info):
+        video_kbps = max(0, probe_bitrate_kbps(info) - (audio_kbps or 0))
+    copy_audio = not audio or (audio.get("codec_name") == "aac" and audio_kbps is not None
+                               and audio_kbps <= VIDEO_AUDIO_COPY_KBPS)
+    out_audio = (audio_kbps if copy_audio else VIDEO_AUDIO_KBPS) if audio else 0
+
+    if mode == "size":
+        # The whole file has to fit: kept video plus whatever audio ends up in it
+        budget_kbps = int(target_mb * 8000 / duration)
+        under_target = bool(video_kbps and out_audio is not None and video_kbps + out_audio <= budget_kbps)
+        over = f"above the {budget_kbps} kb/s budget ({out_audio} kb/s of it audio)"
+    else:
+        under_target = bool(video_kbps and target_kbps and video_kbps <= target_kbps)
+        over = f"above the {target_kbps or '?'} kb/s target"
+    efficient = False
+    if mode == "crf":
+        pixel_rate = _pixel_rate(info)
+        bpp = video_kbps * 1000 / pixel_rate if video_kbps and pixel_rate else None
+        efficient = bool(bpp is not None and bpp <= VIDEO_EFFICIENT_BPP)
+    copy_video = video.get("codec_name") in VIDEO_COPY_CODECS and (under_target or efficient)
+    why_copy = "at or below the target" if under_target else f"efficient ({bpp:.3f} bits/pixel)" if efficient else ""
+
+    if copy_video and copy_audio:
+        action, reason = "remux", f"{video['codec_name']} at {video_kbps} kb/s is already {why_copy}"
+    elif copy_video:
+        action = "audio"
+        reason = (f"{video['codec_name']} at {video_kbps} kb/s is already {why_copy}; "
+                  f"{audio.get('codec_name')} audio at {audio_kbps or '?'} kb/s is re-encoded")
+    elif video.get("codec_name") not in VIDEO_COPY_CODECS:
+        action, reason = "full", f"{video.get('codec_name') or 'unknown'} video is converted to h264"
+    else:
+        action = "full"
+        reason = f"{video.get('codec_name')} at {video_kbps or '?'} kb/s is {over}"
+
+    plan = {"action": action, "label": VIDEO_PLANS[action], "reason": reason}
+    try:
+        source_bytes = int(info["format"]["size"])
+    except (KeyError, TypeError, ValueError):
+        source_bytes = None
+    out_video = video_kbps if copy_video else target_kbps
+    if source_bytes and out_video is not None and out_audio is not None:
+        # Scale the real file size by the bitrate ratio so container overhead carries over
+        source_kbps = (video_kbps or 0) + (audio_kbps or 0)
+        if source_kbps:
+            estimated = int(source_bytes * (out_video + out_audio) / source_kbps)
+        else:
+            estimated = int((out_video + out_audio) * 1000 / 8 * duration)
+        plan.update({"source_mb": round(source_bytes / 1e6, 2), "estimated_mb": round(estimated / 1e6, 2),
+                     "savings_percent": round(100 * (1 - estimated / source_bytes), 1)})
+    return plan
+
+def build_copy_pass(input_abs, output_abs, info, copy_audio=True):
+    """
+    ffmpeg command that keeps the video stream as is (moving the index to the
+    front) and copies or re-encodes the first audio stream.
+    """
+    cmd = [FFMPEG_PATH, "-i", input_abs, "-map", "0:v:0", "-map", "0:a:0?", "-c:v", "copy"]
+    if (probe_stream(info, "video") or {}).get("codec_name") == "hevc":
+        cmd += ["-tag:v", "hvc1"]
+    cmd += ["-c:a", "copy"] if copy_audio else ["-c:a", "aac", "-b:a", f"{VIDEO_AUDIO_KBPS}k"]
+    return cmd + ["-movflags", "+faststart", "-y", output_abs]
+
+# -------------------------
+# Segment-parallel encoding
+# -------------------------
+# x264's frame threading stops scaling after a few cores, so long sources can
+# be cut at keyframes (stream copy), the pieces encoded as separate ffmpeg
+# processes and joined with the concat demuxer. Each job runs up to
+# VIDEO_SEGMENT_WORKERS encoders, sharing its VIDEO_THREADS cores between them.
+VIDEO_ENGINES = ("auto", "single", "segments")
+VIDEO_SEGMENT_WORKERS = VIDEO_THREADS
+VIDEO_SEGMENT_MIN_SECONDS = 10
+# "auto" only splits sources at least this long
+VIDEO_SEGMENT_AUTO_SECONDS = 60
+# Share of the progress bar given to the final join
+VIDEO_SEGMENT_JOIN_PERCENT = 2.0
+
+def video_engine(engine, info):
+    """
+    Resolve "auto" to "single" or "segments" for a probed source.
+    """
+    if engine != "auto":
+        return engine
+    duration = probe_duration(info) or 0
+    if VIDEO_SEGMENT_WORKERS > 1 and duration >= VIDEO_SEGMENT_AUTO_SECONDS:
+        return "segments"
+    return "single"
+
+def split_video_segments(input_abs, work_dir, segment_seconds, err_tail):
+    """
+    Cut the first video stream into pieces of about segment_seconds with
+    `-f segment -c copy`; cuts land on the next keyframe. Returns the paths.
+    """
+    pattern = os.path.join(work_dir, "source_%04d.mkv")
+    cmd = [FFMPEG_PATH, "-i", input_abs, "-map", "0:v:0", "-c", "copy", "-f", "segment",
+           "-segment_time", f"{segment_seconds:.3f}", "-reset_timestamps", "1", "-y", pattern]
+    if _run_ffmpeg(cmd, err_tail, lambda block: None) != 0:
+        raise RuntimeError(err_tail[-1] if err_tail else "ffmpeg could not split the video")
+    return sorted(os.path.join(work_dir, name) for name in os.listdir(work_dir) if name.startswith("source_"))
+
+def _concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+def segmented_encode(input_abs, output_abs, job_id, mode="vbr", quality=70, speed="balanced", target_mb=None,
+                     cache_key=None, details=None, workers=None):
+    """
+    Video job that splits input_abs at keyframes, encodes the pieces in a pool
+    of `workers` ffmpeg processes and concatenates them, muxing the source
+    audio once at the end. Progress from all pieces is merged into one
+    progress_store record; the done record lists each segment's media length
+    and encode time, plus details.
+    """
+    progress_store.update(job_id, {"status": "starting", "stage": "splitting", "percent": 0, "frame": 0, "fps": 0,
+                                   "bitrate": "", "speed": "", "time": "00:00:00", "eta": None})
+    workers = max(1, workers or VIDEO_SEGMENT_WORKERS)
+    info = probe_media(input_abs)
+    total_seconds = probe_duration(info)
+    work_dir = tempfile.mkdtemp(prefix="segments_")
+    err_tail = deque(maxlen=20)
+    started = time.monotonic()
+    extra, details, segments, ok = details or {}, {}, [], False
+    try:
+        # Two pieces per worker evens out the load when some pieces are slower
+        segment_seconds = max(VIDEO_SEGMENT_MIN_SECONDS, (total_seconds or 0) / (workers * 2))
+        sources = split_video_segments(input_abs, work_dir, segment_seconds, err_tail)
+        if not sources:
+            raise RuntimeError("ffmpeg produced no segments")
+        lengths = [probe_duration(probe_media(path)) or (total_seconds or 0) / len(sources) for path in sources]
+        media_total = sum(lengths) or 1.0
+
+        jobs = []
+        for index, source in enumerate(sources):
+            out = os.path.join(work_dir, f"encoded_{index:04d}.mp4")
+            passes, details = build_video_passes(source, out, info, mode, quality, speed, target_mb,
+                                                 passlog=os.path.join(work_dir, f"pass_{index:04d}"), audio=False,
+                                                 threads=max(1, VIDEO_THREADS // workers))
+            jobs.append((index, out, passes))
+        pass_count = len(jobs[0][2])
+
+        lock = threading.Lock()
+        # Set by the first segment that fails; the others stop instead of running to the end
+        cancel = threading.Event()
+        failures = []
+        done_seconds = [0.0] * len(jobs)
+        frames = [0] * len(jobs)
+        segments = [None] * len(jobs)
+        encode_started = time.monotonic()
+
+        def publish(index, pass_index, block):
+            seconds = _progress_seconds(block)
+            with lock:
+                if seconds is not None:
+                    done_seconds[index] = pass_index * lengths[index] + min(max(seconds, 0.0), lengths[index])
+                if pass_index == pass_count - 1 and block.get("frame", "").isdigit():
+                    frames[index] = int(block["frame"])
+                fraction = sum(done_seconds) / (media_total * pass_count)
+                elapsed = time.monotonic() - encode_started
+                status_obj = {
+                    "status": "running",
+                    "stage": "encoding",
+                    "percent": round(min(fraction, 1.0) * (100.0 - VIDEO_SEGMENT_JOIN_PERCENT), 2),
+                    "frame": sum(frames),
+                    "fps": round(sum(frames) / elapsed, 2) if elapsed else None,
+                    "bitrate": "",
+                    "speed": "",
+                    "time": _fmt_hms(fraction * media_total),
+                    "eta_seconds": int(elapsed * (1 - fraction) / fraction) if fraction > 0 else None,
+                    "segments_done": sum(1 for s in segments if s),
+                    "segments_total": len(jobs),
+                }
+            progress_store.update(job_id, status_obj)
+
+        def encode(job):
+            index, out, passes = job
+            t0 = time.monotonic()
+            for pass_index, args in enumerate(passes):
+                if cancel.is_set():
+                    raise RuntimeError(failures[0])
+                code = _run_ffmpeg(args, err_tail, lambda block: publish(index, pass_index, block), cancel)
+                if code != 0:
+                    with lock:
+                        if not cancel.is_set():
+                            failures.append(err_tail[-1] if err_tail else f"segment {index + 1} failed")
+                            cancel.set()
+                    raise RuntimeError(failures[0])
+            segments[index] = {"index": index + 1, "seconds": round(lengths[index], 2),
+                               "encode_seconds": round(time.monotonic() - t0, 2)}
+            return out
+
+        with multiprocessing.pool.ThreadPool(min(workers, len(jobs))) as pool:
+            encoded = pool.map(encode, jobs)
+
+        progress_store.update(job_id, {"status": "running", "stage": "joining",
+                                       "percent": 100.0 - VIDEO_SEGMENT_JOIN_PERCENT, "segments_done": len(jobs),
+                                       "segments_total": len(jobs)}, force=True)
+        cmd = [FFMPEG_PATH, "-f", "concat", "-safe", "0", "-i", _concat_list(encoded, os.path.join(work_dir, "list.txt")),
+               "-i", input_abs, "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy",
+               "-c:a", "aac", "-b:a", f"{VIDEO_AUDIO_KBPS}k", "-movflags", "+faststart", "-y", output_abs]
+        ok = _run_ffmpeg(cmd, err_tail, lambda block: None) == 0
+        details.update({"engine": "segments", "workers": workers, "segments": segments}, **extra)
+        frame_total = sum(frames)
+    except Exception as e:
+        err_tail.append(str(e))
+        frame_total = None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if ok and os.path.exists(output_abs):
+            done_obj = _video_done_record(output_abs, time.monotonic() - started, frame_total, total_seconds, details)
+            if cache_key:
+                result_cache.put(cache_key, output_abs)
+        else:
+            done_obj = {"status": "failed", "error": err_tail[-1] if err_tail else "output file missing"}
+        progress_store.update(job_id, done_obj, force=True)
+
+# -------------------------
+# Background jobs (converters)
+# -------------------------
+# Document converters get their own queue so they never wait behind video encodes.
+JOB_MAX_CONCURRENT = 2
+
+converter_jobs = InProcessBackend(JOB_MAX_CONCURRENT)
+
+class JobReporter:
+    """
+    Progress handle passed to converters as report=. Stage changes are always
+    published; page updates go through progress_store's throttle.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = {"status": "running", "stage": "", "percent": 0}
+        self.summary_data = None
+
+    def stage(self, name, percent=None):
+        self.state["stage"] = name
+        if percent is not None:
+            self.state["percent"] = round(percent, 2)
+        progress_store.update(self.job_id, self.state, force=True)
+
+    def page(self, done, total):
+        self.state["page"] = done
+        self.state["pages"] = total
+        self.state["percent"] = round(done * 100.0 / total, 2) if total else 0
+        progress_store.update(self.job_id, self.state)
+
+    def summary(self, data):
+        # Kept for the done record rather than published with progress
+        self.summary_data = data
+
+class _NullReporter:
+    summary_data = None
+
+    def stage(self, name, percent=None):
+        pass
+
+    def page(self, done, total):
+        pass
+
+    def summary(self, data):
+        pass
+
+# Default report= for synchronous calls
+NULL_REPORT = _NullReporter()
+
+class SummaryReporter(_NullReporter):
+    """
+    report= for synchronous calls that only want the converter's summary.
+    """
+    def summary(self, data):
+        self.summary_data = data
+
+def _done_record(output_path, download_name):
+    return {"status": "done", "percent": 100.0, "eta_seconds": 0,
+            "size": os.path.getsize(output_path), "output": output_path,
+            "download_name": download_name}
+
+def _run_job(job_id, func, args, kwargs, output_path, download_name, cache_key):
+    report = JobReporter(job_id)
+    report.stage("starting")
+    try:
+        func(*args, report=report, **kwargs)
+    except Exception as e:
+        progress_store.update(job_id, {"status": "error", "error": str(e)}, force=True)
+        return
+    if cache_key:
+        result_cache.put(cache_key, output_path)
+    record = _done_record(output_path, download_name)
+    if report.summary_data:
+        record["report"] = report.summary_data
+    progress_store.update(job_id, record, force=True)
+
+def start_job(func, args, output_path, download_name, kwargs=None, cache_key=None):
+    """
+    Queue func(*args, report=..., **kwargs), which must write output_path.
+    Returns the job_id; poll /jobs/<job_id> and fetch /jobs/<job_id>/download.
+    """
+    job_id = uuid.uuid4().hex
+    progress_store.update(job_id, {"status": "queued", "percent": 0})
+    converter_jobs.submit(job_id, _run_job, (job_id, func, args, kwargs or {}, output_path, download_name, cache_key))
+    return job_id
 
 # -------------------------
 # Compression helpers (shared utilities)
 # -------------------------
-def _recompress_image_file(path, image_max_width, image_quality):
+# Worker processes used to recompress embedded Office media, and how long a
+# single image may take before its original bytes are kept instead.
+MEDIA_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+MEDIA_TIMEOUT = 60
+
+# Decompression-bomb guard: images with more pixels are refused before decoding,
+# which bounds the memory a worker can need for one image.
+IMAGE_MAX_PIXELS = 120_000_000
+# Box-reduce no further than this multiple of the target size before the final
+# LANCZOS resample, so quality matches a full-size resample.
+IMAGE_REDUCING_GAP = 2
+
+if HAVE_PIL:
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+def open_image(data):
+    """
+    Open encoded image bytes without decoding them; raises ValueError past
+    IMAGE_MAX_PIXELS.
+    """
+    img = Image.open(BytesIO(data))
+    w, h = img.size
+    if w * h > IMAGE_MAX_PIXELS:
+        raise ValueError(f"Image is {w}x{h}, more than {IMAGE_MAX_PIXELS} pixels")
+    return img
+
+def downscale_image(img, max_width):
+    """
+    Resize a freshly opened image to at most max_width wide. JPEGs are decoded
+    at a reduced DCT scale (draft) no smaller than IMAGE_REDUCING_GAP times the
+    target, and resize() box-reduces the rest of the way down to that margin,
+    so the full-size bitmap is never resampled with LANCZOS.
     """
-    Recompress a single image file (replace original).
-    Returns True if replaced, False otherwise.
+    w, h = img.size
+    if w <= max_width:
+        return img
+    size = (max_width, max(1, int((max_width / w) * h)))
+
+    if img.format == "JPEG":
+        img.draft(img.mode, (size[0] * IMAGE_REDUCING_GAP, size[1] * IMAGE_REDUCING_GAP))
+    return img.resize(size, Image.LANCZOS, reducing_gap=IMAGE_REDUCING_GAP)
+
+class CompressionStats:
+    """
+    Per-part record of what an Office compressor did: sizes, the decision
+    taken and seconds spent, plus timed stages. as_dict() is the JSON report.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.parts = {}
+        self.stages = {}
+
+    def part(self, name, **fields):
+        self.parts.setdefault(name, {}).update(fields)
+
+    def stage(self, name, seconds):
+        self.stages[name] = round(self.stages.get(name, 0) + seconds, 4)
+
+    def as_dict(self, input_path, output_path):
+        input_bytes = os.path.getsize(input_path)
+        output_bytes = os.path.getsize(output_path)
+        return {
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "saved_bytes": input_bytes - output_bytes,
+            "saved_percent": round((input_bytes - output_bytes) * 100.0 / input_bytes, 2) if input_bytes else 0,
+            "seconds": round(time.monotonic() - self.started, 4),
+            "stages": self.stages,
+            "parts": [dict(name=name, **fields) for name, fields in sorted(self.parts.items())],
+        }
+
+def _recompress_image_bytes(data, image_max_width, image_quality, quantize_alpha=False):
+    """
+    Recompress a single encoded image held in memory.
+    Returns the new bytes, or None if the data is not an image Pillow can handle.
+    PNGs with transparency stay PNG, palette-quantized if quantize_alpha is set;
+    everything else becomes JPEG.
     """
     if not HAVE_PIL:
-        return False
+        return None
     try:
-        img = Image.open(path)
+        img = open_image(data)
     except Exception:
-        return False
+        return None
 
     try:
-        w, h = img.size
-        if w > image_max_width:
-            new_h = int((image_max_width / w) * h)
-            img = img.resize((image_max_width, new_h), Image.LANCZOS)
-
+        # Read before resizing: resized copies have no format
         fmt = (img.format or "").upper()
-       
-        if fmt == "PNG" and (img.mode in ("RGBA", "LA") or "transparency" in getattr(img, "info", {})):
+        img = downscale_image(img, image_max_width)
+
+        buf = BytesIO()
+        if fmt == "PNG" and has_alpha(img):
+            if quantize_alpha:
+                img = img.convert("RGBA").quantize(256, method=Image.Quantize.FASTOCTREE)
             # try to optimize PNG (lossless)
-            img.save(path, format="PNG", optimize=True)
+            img.save(buf, format="PNG", optimize=True)
         else:
             rgb = img.convert("RGB")
-            rgb.save(path, format="JPEG", quality=int(image_quality), optimize=True)
-        return True
+            rgb.save(buf, format="JPEG", quality=int(image_quality), optimize=True)
+        return buf.getvalue()
+    except Exception:
+        return None
+
+def recompress_media(items, image_max_width, image_quality, quantize_alpha=False, workers=None, timeout=None,
+                     stats=None):
+    """
+    Recompress a batch of images {name: bytes} across a process pool.
+    Returns {name: new_bytes} for every image whose recompressed bytes are
+    smaller; images that grow, fail or exceed the per-image timeout are left
+    out so callers keep the original. Seconds per image go to stats.
+    Output is byte-identical to running _recompress_image_bytes serially.
+    """
+    workers = MEDIA_WORKERS if workers is None else workers
+    timeout = MEDIA_TIMEOUT if timeout is None else timeout
+    args = (image_max_width, image_quality, quantize_alpha)
+    results = {}
+
+    def finish(name, out, seconds):
+        if out is not None and len(out) < len(items[name]):
+            results[name] = out
+        if stats:
+            stats.part(name, seconds=round(seconds, 4), recompressed_bytes=len(out) if out is not None else None)
+
+    if workers <= 1 or len(items) <= 1:
+        for name, data in items.items():
+            started = time.monotonic()
+            finish(name, _recompress_image_bytes(data, *args), time.monotonic() - started)
+        return results
+
+    size = min(workers, len(items))
+    pending = deque(items)
+    inflight = {}
+    wake = threading.Event()
+
+    def _done(_):
+        wake.set()
+
+    pool = multiprocessing.Pool(size)
+    try:
+        while pending or inflight:
+            # Keep at most one image per worker in flight so each timeout
+            # measures encode time rather than time spent queued in the pool.
+            while pending and len(inflight) < size:
+                name = pending.popleft()
+                res = pool.apply_async(_recompress_image_bytes, (items[name],) + args,
+                                       callback=_done, error_callback=_done)
+                inflight[name] = (res, time.monotonic())
+
+            wake.wait(0.5)
+            wake.clear()
+
+            for name in [n for n, (res, _) in inflight.items() if res.ready()]:
+                res, started = inflight.pop(name)
+                try:
+                    out = res.get()
+                except Exception:
+                    out = None
+                finish(name, out, time.monotonic() - started)
+
+            if timeout:
+                now = time.monotonic()
+                expired = [n for n, (_, started) in inflight.items() if now - started > timeout]
+                if expired:
+                    # The stuck workers cannot be cancelled individually: replace
+                    # the pool and requeue whatever else was still running.
+                    for name in expired:
+                        inflight.pop(name)
+                        if stats:
+                            stats.part(name, timed_out=True)
+                    pool.terminate()
+                    pending.extendleft(reversed(list(inflight)))
+                    inflight.clear()
+                    pool = multiprocessing.Pool(size)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+    return results
+
+# Target-size search: images above this many pixels are probed downscaled first,
+# and the probe's estimate is trusted to within this many quality steps.
+IMAGE_PROBE_MIN_PIXELS = 1_000_000
+IMAGE_PROBE_MARGIN = 8
+
+# Output formats for image_compression; "auto" encodes every one that keeps
+# the image's transparency and returns the smallest. PNG output is quantized
+# to a 256-colour palette, so it has no quality setting; that is lossy for
+# images with more colours, so "auto" only tries PNG when it would be lossless.
+IMAGE_OUTPUT_FORMATS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+if HAVE_AVIF:
+    IMAGE_OUTPUT_FORMATS["avif"] = ".avif"
+
+def has_alpha(img):
+    return img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+
+def prepare_image(img, fmt):
+    """
+    Convert a decoded image to the mode fmt is encoded from: RGB for JPEG,
+    otherwise RGBA when it has transparency.
+    """
+    if fmt != "jpeg" and has_alpha(img):
+        return img if img.mode == "RGBA" else img.convert("RGBA")
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+def encode_image(img, fmt, quality=None):
+    buf = BytesIO()
+    if fmt == "jpeg":
+        img.save(buf, "JPEG", optimize=True, quality=int(quality))
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=int(quality), method=4)
+    elif fmt == "avif":
+        img.save(buf, "AVIF", quality=int(quality))
+    elif fmt == "png":
+        img.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, "PNG", optimize=True)
+    else:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    return buf.getvalue()
+
+def _bisect_quality(img, lo, hi, max_bytes, fmt="jpeg"):
+    """
+    Highest quality in [lo, hi] whose encoding fits max_bytes, as (quality, data),
+    or None. Assumes size grows with quality.
+    """
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = encode_image(img, fmt, mid)
+        if len(data) <= max_bytes:
+            best = (mid, data)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+def compress_image_to_size(img, max_bytes, max_quality=95, min_quality=10, fmt="jpeg"):
+    """
+    Encode img as the highest-quality fmt image (<= max_quality) that fits in
+    max_bytes, searching quality by bisection on in-memory buffers. Large
+    images are first searched at quarter resolution to narrow the range.
+    Returns (quality, data). The floor is min_quality, or max_quality when
+    that is lower; if even the floor does not fit, its encoding is returned
+    and is over max_bytes, so callers compare len(data) with the budget.
+    PNG has no quality to search and is encoded once, with quality None.
+    """
+    if fmt == "png":
+        return None, encode_image(img, fmt)
+
+    min_quality = min(min_quality, max_quality)
+    lo, hi = min_quality, max_quality
+    w, h = img.size
+    if w * h > IMAGE_PROBE_MIN_PIXELS:
+        probe = img.reduce(4)
+        ratio = (w * h) / float(probe.size[0] * probe.size[1])
+        est = _bisect_quality(probe, min_quality, max_quality, max_bytes / ratio, fmt)
+        est_q = est[0] if est else min_quality
+        lo = max(min_quality, est_q - IMAGE_PROBE_MARGIN)
+        hi = min(max_quality, est_q + IMAGE_PROBE_MARGIN)
+
+    found = _bisect_quality(img, lo, hi, max_bytes, fmt)
+    if found is None and lo > min_quality:
+        # Probe was optimistic: look below the narrowed range
+        found = _bisect_quality(img, min_quality, lo - 1, max_bytes, fmt)
+    elif found and found[0] == hi and hi < max_quality:
+        # Probe was pessimistic: a higher quality may still fit
+        found = _bisect_quality(img, hi + 1, max_quality, max_bytes, fmt) or found
+
+    if found is None:
+        return min_quality, encode_image(img, fmt, min_quality)
+    return found
+
+def compress_image_auto(img, max_bytes, max_quality=95):
+    """
+    Run compress_image_to_size for every output format in parallel threads
+    (Pillow releases the GIL while encoding) and keep the smallest result
+    that fits max_bytes, else the smallest overall. JPEG is skipped for
+    images with transparency, and palette PNG for images with more than 256
+    colours (where it would be lossy). Returns (fmt, quality, data).
+    """
+    img.load()  # decode once here; lazy loading from several threads is not safe
+    formats = [f for f in IMAGE_OUTPUT_FORMATS
+               if not (f == "jpeg" and has_alpha(img)) and not (f == "png" and img.getcolors(256) is None)]
+
+    def encode(job):
+        fmt, own = job
+        return (fmt,) + compress_image_to_size(prepare_image(own, fmt), max_bytes, max_quality, fmt=fmt)
+
+    # save() keeps its options on the Image (encoderinfo): every thread needs its own copy
+    jobs = [(fmt, img.copy()) for fmt in formats]
+    with multiprocessing.pool.ThreadPool(len(formats)) as pool:
+        results = pool.map(encode, jobs)
+    fitting = [r for r in results if len(r[2]) <= max_bytes] or results
+    return min(fitting, key=lambda r: len(r[2]))
+
+def compress_image_data(data, quality=75, target_kb=None, target_ratio=None, fmt="jpeg"):
+    """
+    Compress one encoded image with image_compression's rules: by default
+    never larger than the original and capped at quality; target_kb or
+    target_ratio (percent of the original) set an explicit budget instead.
+    fmt is a key of IMAGE_OUTPUT_FORMATS or "auto". Returns (fmt, data,
+    summary); summary["target_met"] is False when even the lowest quality
+    did not fit the budget.
+    """
+    img = open_image(data)
+    if target_kb:
+        budget = target_kb * 1024
+    elif target_ratio:
+        budget = len(data) * target_ratio / 100.0
+    else:
+        budget = len(data)
+    if fmt == "auto":
+        fmt, used_quality, out = compress_image_auto(img, budget, max_quality=quality)
+    else:
+        used_quality, out = compress_image_to_size(prepare_image(img, fmt), budget, max_quality=quality, fmt=fmt)
+    summary = {"format": fmt, "quality": used_quality, "input_bytes": len(data), "output_bytes": len(out),
+               "budget_bytes": int(budget), "target_met": len(out) <= budget}
+    return fmt, out, summary
+
+# Batch image compression: accepted inputs and the process pool size.
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png"}
+IMAGE_BATCH_WORKERS = MEDIA_WORKERS
+
+def _compress_image_entry(entry):
+    """
+    Pool worker: entry is (name, path, zip_member, options). Images inside
+    an uploaded zip are read here so only names cross the process boundary.
+    Returns (name, fmt, data, summary, error).
+    """
+    name, path, member, options = entry
+    try:
+        if member is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            with ZipFile(path) as z:
+                data = z.read(member)
+        return (name,) + compress_image_data(data, **options) + (None,)
+    except Exception as e:
+        return name, None, None, None, str(e)
+
+def iter_compressed_images(entries, workers=None):
+    """
+    Yield _compress_image_entry results in completion order, across a
+    process pool when there is more than one worker and image.
+    """
+    workers = IMAGE_BATCH_WORKERS if workers is None else workers
+    if workers <= 1 or len(entries) <= 1:
+        for entry in entries:
+            yield _compress_image_entry(entry)
+        return
+
+    pool = multiprocessing.Pool(min(workers, len(entries)))
+    try:
+        for result in pool.imap_unordered(_compress_image_entry, entries):
+            yield result
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+class _StreamSink:
+    """
+    Write-only file object for ZipFile (or a compressor); read back what was
+    written with drain(). ZipFile falls back to data descriptors since it cannot seek.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+# Bytes read from a file-like zip member per step while streaming
+ZIP_STREAM_CHUNK = 1024 * 1024
+
+# Members with these extensions are stored, not deflated, by create_zip
+ZIP_STORED_EXTENSIONS = {
+    "jpg", "jpeg", "png", "gif", "webp", "avif", "heic",
+    "mp4", "mov", "mkv", "webm", "avi", "mp3", "m4a", "aac", "ogg",
+    "zip", "gz", "tgz", "bz2", "xz", "7z", "rar", "zst",
+    "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub",
+}
+
+# Parallel deflate (pigz style): file members are cut into ZIP_DEFLATE_BLOCK
+# blocks that are deflated concurrently by ZIP_WORKERS threads (zlib releases
+# the GIL) and concatenated. Each block is primed with the 32 KiB before it, so
+# the ratio stays close to a single deflate stream. Members of one block or
+# less are deflated whole, several at a time, and written in order.
+ZIP_WORKERS = max(1, os.cpu_count() or 1)
+ZIP_DEFLATE_BLOCK = 1024 * 1024
+
+# create_zip presets: speed vs ratio. "level" in the form overrides the preset's
+# and must lie in its "levels" (None: the codec takes no level).
+ZIP_PRESETS = {
+    "fastest": {"format": "zip", "compression": ZIP_DEFLATED, "level": 1, "levels": range(0, 10)},
+    "balanced": {"format": "zip", "compression": ZIP_DEFLATED, "level": 6, "levels": range(0, 10)},
+    "small": {"format": "zip", "compression": ZIP_DEFLATED, "level": 9, "levels": range(0, 10)},
+    "bzip2": {"format": "zip", "compression": zipfile.ZIP_BZIP2, "level": 9, "levels": range(1, 10)},
+    "smallest": {"format": "zip", "compression": zipfile.ZIP_LZMA, "level": None, "levels": None},
+}
+if HAVE_ZSTD:
+    ZIP_PRESETS["zstd"] = {"format": "tar.zst", "compression": None, "level": 10, "levels": range(1, 23)}
+ZIP_DEFAULT_PRESET = "balanced"
+
+def _deflate_block(block, level, zdict, last):
+    """
+    Raw-deflate one block so that blocks can be concatenated: every block but
+    the last ends on a byte boundary (Z_SYNC_FLUSH) instead of finishing.
+    """
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else \
+        zlib.compressobj(level, zlib.DEFLATED, -15)
+    return comp.compress(block) + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def _begin_deflated_member(z, zinfo):
+    """
+    Write the local header of a deflated member that bypasses ZipFile's
+    writer; its sizes and CRC follow the data in a descriptor.
+    """
+    zinfo.compress_type = ZIP_DEFLATED
+    zinfo.flag_bits |= 0x08   # sizes and CRC follow in a data descriptor
+    zinfo.header_offset = z.fp.tell()
+    z._writecheck(zinfo)
+    z._didModify = True
+    z.fp.write(zinfo.FileHeader(True))
+
+def _end_deflated_member(z, zinfo, crc, size, compressed):
+    zinfo.CRC = crc
+    zinfo.file_size = size
+    zinfo.compress_size = compressed
+    z.fp.write(struct.pack("<LLQQ", 0x08074b50, crc, compressed, size))
+    z.start_dir = z.fp.tell()
+    z.filelist.append(zinfo)
+    z.NameToInfo[zinfo.filename] = zinfo
+
+def _write_deflated_whole(z, zinfo, raw, data):
+    """
+    Write one member whose raw bytes were already deflated in one piece.
+    """
+    _begin_deflated_member(z, zinfo)
+    z.fp.write(data)
+    _end_deflated_member(z, zinfo, zlib.crc32(raw), len(raw), len(data))
+
+def _write_deflated_parallel(z, sink, zinfo, stream, level, pool, window, read_ahead=()):
+    """
+    Write one file member into z, deflating its blocks across pool. Yields
+    output as it is produced; at most window blocks are in flight.
+    read_ahead: blocks already read from the start of stream.
+    """
+    level = 6 if level is None else level
+    _begin_deflated_member(z, zinfo)
+
+    read_ahead = deque(read_ahead)
+
+    def read_block():
+        return read_ahead.popleft() if read_ahead else stream.read(ZIP_DEFLATE_BLOCK)
+
+    crc = size = compressed = 0
+    pending = deque()
+    prev = b""
+    block = read_block()
+    while True:
+        nxt = read_block() if block else b""
+        pending.append((block, pool.apply_async(_deflate_block, (block, level, prev[-32768:], not nxt))))
+        prev = block
+        block = nxt
+        while pending and (len(pending) >= window or not block):
+            raw, res = pending.popleft()
+            data = res.get()
+            crc = zlib.crc32(raw, crc)
+            size += len(raw)
+            compressed += len(data)
+            z.fp.write(data)
+            yield sink.drain()
+        if not block:
+            break
+
+    _end_deflated_member(z, zinfo, crc, size, compressed)
+
+def stream_zip(members, compression=ZIP_DEFLATED, compresslevel=None, workers=1):
+    """
+    Build a zip from an iterable of (name, data) and yield it in pieces as it
+    is written, so a response can start before the last member exists.
+    name may be a ZipInfo, whose compress_type then applies; data may be bytes
+    or a readable file object, which is copied ZIP_STREAM_CHUNK at a time.
+    With workers > 1, deflated file members are compressed in parallel: large
+    ones block by block, small ones several members at a time.
+    """
+    sink = _StreamSink()
+    # Parallel deflate writes through ZipFile internals; without them use zipfile as is
+    pool = multiprocessing.pool.ThreadPool(workers) if workers > 1 and ZIP_RAW_WRITES else None
+    window = workers * 2
+    # Small members being deflated in the pool, as (zinfo, raw, result), oldest first
+    ahead = deque()
+
+    def write_ahead(z, keep):
+        while len(ahead) > keep:
+            zinfo, raw, res = ahead.popleft()
+            _write_deflated_whole(z, zinfo, raw, res.get())
+            piece = sink.drain()
+            if piece:
+                yield piece
+
+    try:
+        with ZipFile(sink, "w", compression, compresslevel=compresslevel) as z:
+            for name, data in members:
+                if not isinstance(name, zipfile.ZipInfo):
+                    name = zipfile.ZipInfo(name, time.localtime()[:6])
+                    name.compress_type = compression
+                if compresslevel is not None and name.compress_type != zipfile.ZIP_STORED:
+                    # ZipFile.open only applies its level to names given as str
+                    name._compresslevel = compresslevel
+                if hasattr(data, "read") and pool and name.compress_type == ZIP_DEFLATED:
+                    first = data.read(ZIP_DEFLATE_BLOCK)
+                    second = data.read(ZIP_DEFLATE_BLOCK) if first else b""
+                    if not second:
+                        level = 6 if compresslevel is None else compresslevel
+                        ahead.append((name, first, pool.apply_async(_deflate_block, (first, level, b"", True))))
+                        yield from write_ahead(z, window - 1)
+                        continue
+                    yield from write_ahead(z, 0)
+                    for piece in _write_deflated_parallel(z, sink, name, data, compresslevel, pool, window,
+                                                          (first, second)):
+                        if piece:
+                            yield piece
+                    continue
+                yield from write_ahead(z, 0)
+                if hasattr(data, "read"):
+                    # Size unknown up front: always leave room for zip64 sizes
+                    with z.open(name, "w", force_zip64=True) as dest:
+                        while True:
+                            chunk = data.read(ZIP_STREAM_CHUNK)
+                            if not chunk:
+                                break
+                            dest.write(chunk)
+                            piece = sink.drain()
+                            if piece:
+                                yield piece
+                else:
+                    z.writestr(name, data)
+                piece = sink.drain()
+                if piece:
+                    yield piece
+            yield from write_ahead(z, 0)
+        yield sink.drain()
+    finally:
+        if pool:
+            pool.terminate()
+
+def stream_tar_zst(members, level=10):
+    """
+    Like stream_zip, but a zstd-compressed tarball (multi-threaded zstd).
+    members: iterable of (arcname, readable file object, size in bytes).
+    """
+    sink = _StreamSink()
+    cctx = zstandard.ZstdCompressor(level=level, threads=-1)
+    with cctx.stream_writer(sink, closefd=False) as zw:
+        for arcname, stream, size in members:
+            info = tarfile.TarInfo(arcname)
+            info.size = size
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            zw.write(info.tobuf(tarfile.PAX_FORMAT))
+            while True:
+                chunk = stream.read(ZIP_STREAM_CHUNK)
+                if not chunk:
+                    break
+                zw.write(chunk)
+                piece = sink.drain()
+                if piece:
+                    yield piece
+            zw.write(b"\0" * (-size % tarfile.BLOCKSIZE))
+        # End-of-archive marker: two zero blocks
+        zw.write(b"\0" * (2 * tarfile.BLOCKSIZE))
+    yield sink.drain()
+
+def _drop_members(batch):
+    """
+    Transform callback for rewrite_ooxml that removes every matched member.
+    """
+    return {name: None for name in batch}
+
+def _zipfile_internals_available():
+    """
+    Raw member copies and the parallel deflate write through ZipFile's private
+    members; check they are still there so a new CPython falls back instead of
+    producing broken archives.
+    """
+    try:
+        with ZipFile(BytesIO(), "w") as z:
+            needed = ("_lock", "fp", "start_dir", "filelist", "NameToInfo", "_didModify", "_writecheck")
+            return all(hasattr(z, attr) for attr in needed) and hasattr(zipfile.ZipInfo, "FileHeader")
     except Exception:
         return False
 
-def _strip_docprops_and_rezip(src_dir, out_path):
+ZIP_RAW_WRITES = _zipfile_internals_available()
+
+def _copy_zip_member_raw(zin, zout, info):
+    """
+    Copy one member from zin into zout as-is, still compressed (no inflate/deflate).
+    Without ZIP_RAW_WRITES the member is inflated and re-deflated instead.
     """
-    Create zip from src_dir while skipping common metadata files (docProps).
+    if not ZIP_RAW_WRITES:
+        zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+        zinfo.compress_type = info.compress_type
+        zinfo.external_attr = info.external_attr
+        zout.writestr(zinfo, zin.read(info))
+        return
+
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    # Sizes go in the local header, so a data descriptor is never needed
+    zinfo.flag_bits = info.flag_bits & ~0x08
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+
+    with zin._lock, zout._lock:
+        zin.fp.seek(info.header_offset)
+        header = zin.fp.read(zipfile.sizeFileHeader)
+        name_len, extra_len = struct.unpack("<HH", header[26:30])
+        zin.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+
+        zinfo.header_offset = zout.fp.tell()
+        zout.fp.write(zinfo.FileHeader(zip64))
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = zin.fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member {info.filename}")
+            zout.fp.write(chunk)
+            remaining -= len(chunk)
+
+        zout.start_dir = zout.fp.tell()
+        zout.filelist.append(zinfo)
+        zout.NameToInfo[zinfo.filename] = zinfo
+        zout._didModify = True
+
+def rewrite_ooxml(input_file, output_path, transforms, compresslevel=None, stats=None):
     """
-    with ZipFile(out_path, 'w', ZIP_DEFLATED) as zout:
-        for folder, _, files in os.walk(src_dir):
-            for fname in files:
-                absf = os.path.join(folder, fname)
-                relf = os.path.relpath(absf, src_dir)
-                
-                if relf.startswith("docProps/"):
+    Stream an OOXML package (DOCX/PPTX/XLSX) into output_path member by member.
+    transforms: list of (prefix, callback). Members whose name starts with the
+    prefix (or, if prefix is callable, for which prefix(name) is true) are read
+    and passed together as {name: bytes} to callback, which returns
+    {name: new_bytes} for members it changes, or {name: None} to drop them.
+    Callbacks run in list order and a member goes to the first that matches.
+    Every other member is copied raw, still compressed, in its original order.
+    Each matched member's sizes and outcome go to stats.
+    """
+    with ZipFile(input_file, 'r') as zin, \
+            ZipFile(output_path, 'w', ZIP_DEFLATED, compresslevel=compresslevel) as zout:
+        infos = zin.infolist()
+
+        replaced = {}
+        claimed = set()
+        for prefix, callback in transforms:
+            match = prefix if callable(prefix) else (lambda name, p=prefix: name.startswith(p))
+            batch = {}
+            for info in infos:
+                if info.filename in claimed or info.is_dir() or not match(info.filename):
                     continue
-                
-                zout.write(absf, relf)
-    return out_path
+                claimed.add(info.filename)
+                batch[info.filename] = zin.read(info)
+            if batch:
+                replaced.update(callback(batch))
+
+        for info in infos:
+            if info.filename not in replaced:
+                if stats and info.filename in claimed:
+                    stats.part(info.filename, original_bytes=info.file_size, output_bytes=info.file_size,
+                               action="kept")
+                _copy_zip_member_raw(zin, zout, info)
+                continue
+            data = replaced[info.filename]
+            if stats:
+                stats.part(info.filename, original_bytes=info.file_size,
+                           output_bytes=0 if data is None else len(data),
+                           action="dropped" if data is None else "rewritten")
+            if data is None:
+                continue
+            zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+            zinfo.compress_type = ZIP_DEFLATED
+            zinfo.external_attr = info.external_attr
+            zout.writestr(zinfo, data)
+    return output_path
+
+# Perceptual dedup: images whose 64-bit dHashes differ in at most this many
+# bits are treated as the same picture...
+DEDUP_HASH_DISTANCE = 4
+# ...provided their aspect ratios agree within this fraction and their mean
+# R/G/B levels within this many steps (0-255), so a dHash match alone never
+# merges a differently shaped or differently coloured picture.
+DEDUP_ASPECT_TOLERANCE = 0.02
+DEDUP_COLOR_DISTANCE = 8
+# Below this grey-level standard deviation an image is too flat for its dHash
+# to mean anything (every flat image hashes to 0), so it is never merged.
+DEDUP_MIN_STDDEV = 2.0
+
+def _dhash(data):
+    """
+    Perceptual signature of an encoded image as (bits, alpha, area, aspect,
+    mean_rgb), where bits is a 64-bit difference hash. None if it is not an
+    image or is too flat for the hash to tell images apart.
+    """
+    try:
+        img = open_image(data)
+        alpha = has_alpha(img)
+        img.draft("RGB", (64, 64))
+        small = img.convert("RGB").resize((9, 8), Image.LANCZOS)
+    except Exception:
+        return None
+    gray = small.convert("L")
+    if ImageStat.Stat(gray).stddev[0] < DEDUP_MIN_STDDEV:
+        return None
+    px = gray.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    if not bits:
+        return None
+    w, h = img.size
+    return bits, alpha, w * h, w / h, ImageStat.Stat(small).mean
+
+def _same_picture(a, b):
+    bits, alpha, _, aspect, mean = a
+    other_bits, other_alpha, _, other_aspect, other_mean = b
+    return (alpha == other_alpha
+            and abs(aspect / other_aspect - 1) <= DEDUP_ASPECT_TOLERANCE
+            and max(abs(x - y) for x, y in zip(mean, other_mean)) <= DEDUP_COLOR_DISTANCE
+            and bin(bits ^ other_bits).count("1") <= DEDUP_HASH_DISTANCE)
+
+class MediaDeduper:
+    """
+    Collapses duplicate media parts of one OOXML package into a single part.
+    Used as three rewrite_ooxml transforms, in this order:
+    - media: maps duplicates (identical bytes, or with perceptual=True, the
+      same shape, colour and near-identical dHash) onto one canonical part,
+      recompresses only the
+      canonical parts with recompress({name: bytes}) and drops the rest;
+    - rels: repoints relationship Targets from duplicates to canonical parts;
+    - content_types: removes Overrides for the dropped parts.
+    """
+    def __init__(self, recompress, perceptual=False, stats=None):
+        self.recompress = recompress
+        self.perceptual = perceptual
+        self.stats = stats
+        self.replaced = {}   # duplicate part name -> canonical part name
+
+    def find_duplicates(self, batch):
+        by_digest = {}
+        for name, data in batch.items():
+            digest = hashlib.sha256(data).digest()
+            if digest in by_digest:
+                self.replaced[name] = by_digest[digest]
+            else:
+                by_digest[digest] = name
+
+        if self.perceptual:
+            hashed = [(name, _dhash(batch[name])) for name in by_digest.values()]
+            # Largest first, so each group keeps its highest-resolution copy
+            hashed = sorted([h for h in hashed if h[1]], key=lambda h: -h[1][2])
+            kept = []
+            for name, signature in hashed:
+                for kept_name, kept_signature in kept:
+                    if _same_picture(signature, kept_signature):
+                        self.replaced[name] = kept_name
+                        break
+                else:
+                    kept.append((name, signature))
+            # Exact duplicates of a part that was itself merged follow it
+            for name, canonical in self.replaced.items():
+                self.replaced[name] = self.replaced.get(canonical, canonical)
+        return self.replaced
+
+    def media(self, batch):
+        self.find_duplicates(batch)
+        if self.stats:
+            for name, canonical in self.replaced.items():
+                self.stats.part(name, duplicate_of=canonical)
+        results = self.recompress({n: d for n, d in batch.items() if n not in self.replaced})
+        results.update({name: None for name in self.replaced})
+        return results
+
+    def rels(self, batch):
+        if not self.replaced:
+            return {}
+        results = {}
+        for name, data in batch.items():
+            # word/_rels/document.xml.rels holds targets relative to word/
+            base = posixpath.dirname(posixpath.dirname(name))
+
+            def repoint(m):
+                tag = m.group(0)
+                target = re.search(r'Target=(["\'])(.*?)\1', tag)
+                if not target or "External" in tag:
+                    return tag
+                path = target.group(2)
+                part = posixpath.normpath(path[1:] if path.startswith("/") else posixpath.join(base, path))
+                canonical = self.replaced.get(part)
+                if canonical is None:
+                    return tag
+                new = "/" + canonical if path.startswith("/") else posixpath.relpath(canonical, base or ".")
+                return tag[:target.start(2)] + new + tag[target.end(2):]
+
+            text = data.decode("utf-8")
+            new_text = re.sub(r"<Relationship\b[^>]*>", repoint, text)
+            if new_text != text:
+                results[name] = new_text.encode("utf-8")
+        return results
+
+    def content_types(self, batch):
+        if not self.replaced:
+            return {}
+        results = {}
+        for name, data in batch.items():
+            text = data.decode("utf-8")
+            new_text = re.sub(r'<Override\b[^>]*PartName="/([^"]*)"[^>]*/>',
+                              lambda m: "" if m.group(1) in self.replaced else m.group(0), text)
+            if new_text != text:
+                results[name] = new_text.encode("utf-8")
+        return results
+
+    def transforms(self, media_prefix):
+        return [
+            (media_prefix, self.media),
+            (lambda name: name.endswith(".rels"), self.rels),
+            ("[Content_Types].xml", self.content_types),
+        ]
 
 # -------------------------
 # Format-specific compressors
 # -------------------------
-def compress_docx_file(input_path, output_path, image_max_width=1600, image_quality=70, remove_core_props=True):
+def compress_docx_file(input_path, output_path, image_max_width=1600, image_quality=70, remove_core_props=True,
+                       dedupe_media=True, perceptual_dedupe=False, report=None):
     """
     Smart DOCX compression:
-    - Unzip docx
+    - Stream the docx member by member
+    - Merge duplicate images in word/media (near-duplicates too if perceptual_dedupe)
     - Downscale images in word/media
     - Remove docProps if remove_core_props True
-    - Rezip to output_path
+    - Copy every other part unchanged
     """
     if not HAVE_PIL:
         raise RuntimeError("Pillow is required for DOCX compression")
 
-    tmpdir = tempfile.mkdtemp(prefix="docx_")
-    try:
-        with ZipFile(input_path, 'r') as zin:
-            zin.extractall(tmpdir)
-
-        media_dir = os.path.join(tmpdir, "word", "media")
-        if os.path.isdir(media_dir):
-            for fname in os.listdir(media_dir):
-                full = os.path.join(media_dir, fname)
-                if os.path.isfile(full):
-                    _recompress_image_file(full, image_max_width, image_quality)
-
-        # Optionally remove core properties files to strip metadata
-        if remove_core_props:
-            prop_paths = ["docProps/core.xml", "docProps/app.xml"]
-            for p in prop_paths:
-                fp = os.path.join(tmpdir, p)
-                if os.path.exists(fp):
-                    try:
-                        os.remove(fp)
-                    except Exception:
-                        pass
-
-        # Rezip while skipping docProps
-        _strip_docprops_and_rezip(tmpdir, output_path)
-        return output_path
-    finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+    report = report or NULL_REPORT
+    stats = CompressionStats()
+    recompress = lambda batch: recompress_media(batch, image_max_width, image_quality, stats=stats)
+    if dedupe_media:
+        transforms = MediaDeduper(recompress, perceptual_dedupe, stats).transforms("word/media/")
+    else:
+        transforms = [("word/media/", recompress)]
+    # Optionally remove core properties files to strip metadata
+    if remove_core_props:
+        transforms.append(("docProps/", _drop_members))
+
+    report.stage("recompressing media")
+    rewrite_ooxml(input_path, output_path, transforms, stats=stats)
+    stats.stage("rewrite", time.monotonic() - stats.started)
+    report.summary(stats.as_dict(input_path, output_path))
+    return output_path
 
-def compress_pptx_file(input_path, output_path, image_max_width=1600, image_quality=70, remove_thumbnails=True, remove_core_props=True):
+def compress_pptx_file(input_path, output_path, image_max_width=1600, image_quality=70, remove_thumbnails=True, remove_core_props=True,
+                       dedupe_media=True, perceptual_dedupe=False, report=None):
     """
     Smart PPTX compression:
-    - Unzip pptx
+    - Stream the pptx member by member
+    - Merge duplicate images in ppt/media (near-duplicates too if perceptual_dedupe)
     - Downscale images in ppt/media
     - Remove slide thumbnails and docProps
-    - Rezip
+    - Copy every other part unchanged
     """
     if not HAVE_PIL:
         raise RuntimeError("Pillow is required for PPTX compression")
 
-    tmpdir = tempfile.mkdtemp(prefix="pptx_")
-    try:
-        with ZipFile(input_path, 'r') as zin:
-            zin.extractall(tmpdir)
-
-        media_dir = os.path.join(tmpdir, "ppt", "media")
-        if os.path.isdir(media_dir):
-            for fname in os.listdir(media_dir):
-                full = os.path.join(media_dir, fname)
-                if os.path.isfile(full):
-                    _recompress_image_file(full, image_max_width, image_quality)
-
-        # Remove thumbnails if exist (commonly in ppt/ or thumbnails/)
-        thumb_paths = [
-            os.path.join(tmpdir, "docProps", "thumbnail.jpeg"),
-            os.path.join(tmpdir, "thumbnail.jpeg"),
-            os.path.join(tmpdir, "ppt", "thumbnails")
-        ]
-        for p in thumb_paths:
-            if os.path.isdir(p):
-                try:
-                    shutil.rmtree(p)
-                except Exception:
-                    pass
-            else:
-                if os.path.exists(p):
-                    try:
-                        os.remove(p)
-                    except Exception:
-                        pass
-
-        # Remove docProps
-        if remove_core_props:
-            prop_paths = ["docProps/core.xml", "docProps/app.xml"]
-            for p in prop_paths:
-                fp = os.path.join(tmpdir, p)
-                if os.path.exists(fp):
-                    try:
-                        os.remove(fp)
-                    except Exception:
-                        pass
-
-        _strip_docprops_and_rezip(tmpdir, output_path)
-        return output_path
-    finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except Exception:
-            pass
+    report = report or NULL_REPORT
+    stats = CompressionStats()
+    recompress = lambda batch: recompress_media(batch, image_max_width, image_quality, stats=stats)
+    if dedupe_media:
+        transforms = MediaDeduper(recompress, perceptual_dedupe, stats).transforms("ppt/media/")
+    else:
+        transforms = [("ppt/media/", recompress)]
+    # Remove thumbnails if exist (commonly in ppt/ or thumbnails/)
+    if remove_thumbnails:
+        for prefix in ("docProps/thumbnail.jpeg", "thumbnail.jpeg", "ppt/thumbnails/"):
+            transforms.append((prefix, _drop_members))
+    # Remove docProps
+    if remove_core_props:
+        transforms.append(("docProps/", _drop_members))
+
+    report.stage("recompressing media")
+    rewrite_ooxml(input_path, output_path, transforms, stats=stats)
+    stats.stage("rewrite", time.monotonic() - stats.started)
+    report.summary(stats.as_dict(input_path, output_path))
+    return output_path
 
 def compress_xlsx_file(input_path, output_path, image_max_width=1600, image_quality=70,
-                       flatten_formulas=True, remove_core_props=True):
+                       flatten_formulas=True, remove_core_props=True, report=None):
 
     if not HAVE_PIL:
         raise RuntimeError("Pillow is required for XLSX compression")
 
-    tmpdir = tempfile.mkdtemp(prefix="xlsx_")
-    try:
-        working_input = input_path
+    working_input = input_path
+
+    report = report or NULL_REPORT
+    stats = CompressionStats()
+
+    # 1) Flatten formulas only if requested (kept in memory, never on disk)
+    if flatten_formulas:
+        report.stage("flattening formulas")
+        started = time.monotonic()
+        try:
+            wb_vals = load_workbook(input_path, data_only=True)
+            flat = BytesIO()
+            wb_vals.save(flat)
+            flat.seek(0)
+            working_input = flat
+        except Exception:
+            working_input = input_path
+        stats.stage("flatten", time.monotonic() - started)
+
+    # 2) Aggressively recompress images in xl/media: JPEG, or palette PNG
+    #    where there is transparency to keep
+    transforms = [
+        ("xl/media/", lambda batch: recompress_media(batch, image_max_width, image_quality, quantize_alpha=True,
+                                                     stats=stats)),
+    ]
+
+    # 3) Remove metadata
+    if remove_core_props:
+        transforms.append(("docProps/", _drop_members))
 
-        # 1) Flatten formulas only if requested
-        if flatten_formulas:
+    # 4) Stream into the output; rewritten parts use maximum compression
+    report.stage("recompressing media")
+    started = time.monotonic()
+    rewrite_ooxml(working_input, output_path, transforms, compresslevel=9, stats=stats)
+    stats.stage("rewrite", time.monotonic() - started)
+
+    # 5) Safety fallback: images already only shrink, so anything larger is
+    #    down to flattening/re-deflating; keep the original file as it is
+    if os.path.getsize(output_path) > os.path.getsize(input_path):
+        shutil.copyfile(input_path, output_path)
+        stats.stage("kept_original", 0)
+
+    report.summary(stats.as_dict(input_path, output_path))
+    return output_path
+
+# -------------------------
+# Result cache (content-addressed)
+# -------------------------
+CACHE_MAX_BYTES = 2 * 1024 ** 3   # total size of cached outputs kept in DOWNLOAD_FOLDER
+CACHE_MAX_AGE = 24 * 3600         # seconds before a cached output is discarded
+CACHE_SWEEP_INTERVAL = 300        # seconds between scans of the folder for files the index does not know
+CACHE_SWEEP_GRACE = 300           # files modified more recently than this are left alone (still being written)
+
+class ResultCache:
+    """
+    Maps hash(input content + tool + params) to an output file in DOWNLOAD_FOLDER.
+    Entries are evicted least-recently-used first once the total size exceeds
+    max_bytes, and unconditionally once older than max_age.
+    With a folder, files there that the index does not know (left over from
+    before a restart, or outputs that were never cached) are adopted by mtime
+    at startup and every sweep_interval, so the limits cover the whole folder.
+    """
+    def __init__(self, max_bytes, max_age, folder=None, sweep_interval=CACHE_SWEEP_INTERVAL,
+                 sweep_grace=CACHE_SWEEP_GRACE):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.folder = folder
+        self.sweep_interval = sweep_interval
+        self.sweep_grace = sweep_grace
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total = 0
+        self._last_sweep = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock:
+            self._expire()
+
+    @staticmethod
+    def make_key(input_path, tool, params=None):
+        digest = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        norm = json.dumps({k: v for k, v in (params or {}).items() if v is not None}, sort_keys=True)
+        return hashlib.sha256(f"{tool}\0{norm}\0{digest.hexdigest()}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Path of the cached output for key, or None on a miss.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry and os.path.exists(entry["path"]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["path"]
+            if entry:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, path):
+        path = os.path.abspath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            for stale in (key, self._file_key(path)):
+                if stale in self._entries:
+                    self._total -= self._entries.pop(stale)["size"]
+            self._entries[key] = {"path": path, "size": size, "created": time.time()}
+            self._total += size
+            self._expire()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._total}
+
+    @staticmethod
+    def _file_key(path):
+        return f"file:{path}"
+
+    def _sweep(self, now):
+        """
+        Add files in folder that no entry points at, oldest first at the LRU end.
+        """
+        self._last_sweep = now
+        known = {e["path"] for e in self._entries.values()}
+        found = []
+        try:
+            with os.scandir(self.folder) as it:
+                for item in it:
+                    path = os.path.abspath(item.path)
+                    if path in known or not item.is_file():
+                        continue
+                    st = item.stat()
+                    if now - st.st_mtime >= self.sweep_grace:
+                        found.append((st.st_mtime, path, st.st_size))
+        except OSError:
+            return
+        for mtime, path, size in sorted(found, reverse=True):
+            key = self._file_key(path)
+            self._entries[key] = {"path": path, "size": size, "created": mtime}
+            self._entries.move_to_end(key, last=False)
+            self._total += size
+
+    def _expire(self):
+        now = time.time()
+        if self.folder and now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+        cutoff = now - self.max_age
+        for key in [k for k, e in self._entries.items() if e["created"] < cutoff]:
+            self._drop(key, delete=True)
+        # The most recent entry stays even if it alone is over the limit
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)), delete=True)
+
+    def _drop(self, key, delete=False):
+        entry = self._entries.pop(key)
+        self._total -= entry["size"]
+        if delete:
+            self.evictions += 1
             try:
-                wb_vals = load_workbook(input_path, data_only=True)
-                flat_path = os.path.join(tmpdir, "flattened.xlsx")
-                wb_vals.save(flat_path)
-                working_input = flat_path
-            except Exception:
-                working_input = input_path
+                os.remove(entry["path"])
+            except OSError:
+                pass
 
-        # 2) Unzip XLSX
-        unzip_dir = os.path.join(tmpdir, "unzipped")
-        os.makedirs(unzip_dir, exist_ok=True)
+result_cache = ResultCache(CACHE_MAX_BYTES, CACHE_MAX_AGE, folder=DOWNLOAD_FOLDER)
 
-        with ZipFile(working_input, 'r') as zin:
-            zin.extractall(unzip_dir)
+# -------------------------
+# Chunked / resumable uploads
+# -------------------------
+UPLOAD_MAX_CHUNK = 64 * 1024 * 1024   # largest single chunk accepted
+UPLOAD_TTL = 24 * 3600                # seconds an idle, unfinished upload is kept
 
-        # 3) Aggressively recompress images in xl/media
-        media_dir = os.path.join(unzip_dir, "xl", "media")
-        if os.path.isdir(media_dir):
-            for fname in os.listdir(media_dir):
-                fpath = os.path.join(media_dir, fname)
-                if not os.path.isfile(fpath):
-                    continue
+class ChunkedUpload:
+    """
+    A finished chunked upload. Quacks like werkzeug's FileStorage (filename,
+    save) so existing routes can take it in place of a multipart file.
+    taken is set once a route has saved or opened it; claimed uploads that
+    were never taken are discarded when the request ends.
+    """
+    def __init__(self, filename, path):
+        self.filename = filename
+        self.path = path
+        self.taken = False
+
+    def save(self, dst):
+        # The data already sits in UPLOAD_FOLDER; moving it is free
+        os.replace(self.path, dst)
+        self.taken = True
+
+    def open(self):
+        f = open(self.path, "rb")
+        self.taken = True
+        return f
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
 
-                try:
-                    img = Image.open(fpath)
+class ChunkedUploadRegistry:
+    """
+    Tracks in-progress uploads. Chunks must arrive at the current offset and are
+    written straight into the upload's file in UPLOAD_FOLDER.
+    """
+    def __init__(self, folder, ttl):
+        self.folder = folder
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._uploads = {}
+
+    def create(self, filename, size=None):
+        self._expire()
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.folder, unique_filename(filename))
+        open(path, "wb").close()
+        with self._lock:
+            self._uploads[upload_id] = {
+                "filename": filename, "path": path, "size": size, "offset": 0,
+                "sha256": hashlib.sha256(), "complete": False,
+                "lock": threading.Lock(), "touched": time.time(),
+            }
+        return upload_id
+
+    def info(self, upload_id):
+        with self._lock:
+            up = self._uploads.get(upload_id)
+        if not up:
+            return None
+        return {"upload_id": upload_id, "filename": up["filename"], "size": up["size"],
+                "offset": up["offset"], "complete": up["complete"]}
+
+    def write_chunk(self, upload_id, offset, stream, length, checksum=None):
+        """
+        Append length bytes from stream at offset. Raises ValueError when the
+        offset is wrong or the chunk checksum (hex SHA-256) does not match.
+        Returns the new offset.
+        """
+        with self._lock:
+            up = self._uploads.get(upload_id)
+        if not up:
+            raise KeyError(upload_id)
+
+        with up["lock"]:
+            if up["complete"]:
+                raise ValueError("upload already complete")
+            if offset != up["offset"]:
+                raise ValueError(f"expected offset {up['offset']}")
+            if up["size"] is not None and offset + length > up["size"]:
+                raise ValueError("chunk runs past declared size")
+
+            chunk_hash = hashlib.sha256()
+            file_hash = up["sha256"].copy()
+            written = 0
+            with open(up["path"], "r+b") as f:
+                f.seek(offset)
+                while written < length:
+                    block = stream.read(min(1024 * 1024, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    chunk_hash.update(block)
+                    file_hash.update(block)
+                    written += len(block)
+
+                if written != length or (checksum and checksum.lower() != chunk_hash.hexdigest()):
+                    # Roll back so the client can resend from the same offset
+                    f.truncate(offset)
+                    raise ValueError("chunk incomplete or checksum mismatch")
+
+            up["offset"] = offset + written
+            up["sha256"] = file_hash
+            up["touched"] = time.time()
+            return up["offset"]
+
+    def complete(self, upload_id, checksum=None):
+        with self._lock:
+            up = self._uploads.get(upload_id)
+        if not up:
+            raise KeyError(upload_id)
+        with up["lock"]:
+            if up["size"] is not None and up["offset"] != up["size"]:
+                raise ValueError(f"only {up['offset']} of {up['size']} bytes received")
+            if checksum and checksum.lower() != up["sha256"].hexdigest():
+                raise ValueError("file checksum mismatch")
+            up["complete"] = True
+            up["touched"] = time.time()
+        return self.info(upload_id)
+
+    def claim(self, upload_id):
+        """
+        Hand a finished upload to a tool; returns a ChunkedUpload or None.
+        """
+        with self._lock:
+            up = self._uploads.get(upload_id)
+            if not up or not up["complete"]:
+                return None
+            del self._uploads[upload_id]
+        return ChunkedUpload(up["filename"], up["path"])
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [u for u, up in self._uploads.items() if up["touched"] < cutoff]
+            dropped = [self._uploads.pop(u) for u in stale]
+        for up in dropped:
+            try:
+                os.remove(up["path"])
+            except OSError:
+                pass
 
-                    # Resize if too large
-                    w, h = img.size
-                    if w > image_max_width:
-                        nh = int((image_max_width / w) * h)
-                        img = img.resize((image_max_width, nh), Image.LANCZOS)
+chunked_uploads = ChunkedUploadRegistry(UPLOAD_FOLDER, UPLOAD_TTL)
 
-                    # Convert everything to JPEG aggressively
-                    rgb = img.convert("RGB")
+def claim_upload(upload_id):
+    """
+    Claim a finished chunked upload for this request. If the route rejects it
+    (never saves or opens it), it is discarded at the end of the request, as
+    it is no longer in the registry for the TTL sweep to find.
+    """
+    upload = chunked_uploads.claim(upload_id)
+    if upload:
+        g.setdefault("claimed_uploads", []).append(upload)
+    return upload
+
+@app.teardown_request
+def discard_unused_uploads(exc=None):
+    for upload in g.pop("claimed_uploads", []):
+        if not upload.taken:
+            upload.discard()
+
+def get_uploaded_file(field="file"):
+    """
+    The request's upload: a finished chunked upload named by upload_id,
+    otherwise the multipart file in field.
+    """
+    upload_id = request.values.get("upload_id")
+    if upload_id:
+        return claim_upload(upload_id)
+    return request.files.get(field)
 
-                    buf = BytesIO()
-                    rgb.save(buf, "JPEG", optimize=True, quality=image_quality)
+def wants_async():
+    """
+    True when the client opted into the job API with async=1.
+    """
+    return request.values.get("async", "").lower() in ("1", "true", "on")
 
-                    with open(fpath, "wb") as f:
-                        f.write(buf.getvalue())
+def job_accepted(job_id):
+    return jsonify({"job_id": job_id,
+                    "status_url": f"/jobs/{job_id}",
+                    "events_url": f"/jobs/{job_id}/events",
+                    "download_url": f"/jobs/{job_id}/download"}), 202
 
-                except Exception:
+def with_summary_header(response, summary):
+    """
+    Attach a converter's summary (minus per-part detail) as X-Compression-Report.
+    The full report, parts included, is in the job record for async=1 requests.
+    """
+    if summary:
+        totals = {k: v for k, v in summary.items() if k != "parts"}
+        response.headers["X-Compression-Report"] = json.dumps(totals, separators=(",", ":"))
+    return response
+
+def send_result(path, download_name):
+    """
+    Send a finished output; async clients get an already-done job instead.
+    """
+    if wants_async():
+        job_id = uuid.uuid4().hex
+        progress_store.update(job_id, _done_record(path, download_name))
+        return job_accepted(job_id)
+    return send_file(path, as_attachment=True, download_name=download_name)
+
+# -------------------------
+# Converters (shared by routes and background jobs)
+# -------------------------
+def convert_pdf_to_docx(in_path, out_path, report=None):
+    report = report or NULL_REPORT
+    report.stage("converting")
+    cv = Converter(in_path)
+    try:
+        cv.convert(out_path)
+    finally:
+        cv.close()
+    return out_path
+
+# Processes used for PDF table extraction, and pages each task handles.
+PDF_TABLE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+PDF_PAGES_PER_TASK = 8
+
+def parse_page_range(spec, total):
+    """
+    Turn "10-20" / "1,3,5-7" (1-based, inclusive) into sorted 0-based page
+    indexes below total. An empty spec selects every page.
+    """
+    if not spec or not spec.strip():
+        return list(range(total))
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        try:
+            start = int(first) if first.strip() else 1
+            end = (int(last) if last.strip() else total) if sep else start
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}")
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range: {part}")
+        pages.update(range(start - 1, min(end, total)))
+    if not pages:
+        raise ValueError("Page range selects no pages")
+    return sorted(pages)
+
+def _extract_tables_for_pages(args):
+    """
+    Worker: first table of each requested page (empty list when none).
+    """
+    import pdfplumber
+
+    in_path, indexes = args
+    tables = []
+    with pdfplumber.open(in_path) as pdf:
+        for i in indexes:
+            page = pdf.pages[i]
+            tables.append(page.extract_table() or [])
+            # Drop the page's parsed objects so a long run stays flat in memory
+            page.close()
+    return tables
+
+def iter_pdf_table_pages(in_path, pages=None, workers=None):
+    """
+    Yield (page_number, rows, pages_selected) in page order. Page chunks are
+    extracted across a process pool and merged back in order as they finish.
+    """
+    import pdfplumber
+
+    workers = PDF_TABLE_WORKERS if workers is None else workers
+    with pdfplumber.open(in_path) as pdf:
+        total = len(pdf.pages)
+    indexes = parse_page_range(pages, total)
+    chunks = [indexes[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(indexes), PDF_PAGES_PER_TASK)]
+    tasks = [(in_path, chunk) for chunk in chunks]
+
+    if workers <= 1 or len(chunks) <= 1:
+        results = map(_extract_tables_for_pages, tasks)
+        for chunk, tables in zip(chunks, results):
+            for i, rows in zip(chunk, tables):
+                yield i + 1, rows, len(indexes)
+        return
+
+    with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+        for chunk, tables in zip(chunks, pool.imap(_extract_tables_for_pages, tasks)):
+            for i, rows in zip(chunk, tables):
+                yield i + 1, rows, len(indexes)
+
+def convert_pdf_tables(in_path, out_path, fmt, report=None, pages=None):
+    """
+    Extract PDF tables into a CSV (fmt="csv") or XLSX (fmt="xlsx") file.
+    pages is an optional 1-based range such as "10-20".
+    Rows are written page by page as they arrive (XLSX via a write-only
+    workbook), so memory stays flat regardless of document length. The header
+    is the first row of the first table; identical rows repeating it on later
+    pages are skipped.
+    """
+    report = report or NULL_REPORT
+    if fmt != "csv" and not HAVE_OPENPYXL:
+        raise RuntimeError("openpyxl missing")
+
+    if fmt == "csv":
+        out = open(out_path, "w", newline="", encoding="utf-8")
+        write_row = csv.writer(out).writerow
+    else:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        write_row = ws.append
+
+    header = None
+    try:
+        for done, (_, table, selected) in enumerate(iter_pdf_table_pages(in_path, pages), 1):
+            for row in table:
+                if header is None:
+                    header = row
+                    if fmt != "csv":
+                        row = [_bold_cell(ws, v) for v in row]
+                elif row == header:
                     continue
+                write_row(row)
+            report.page(done, selected)
 
-        # 4) Remove metadata
-        if remove_core_props:
-            docprops_dir = os.path.join(unzip_dir, "docProps")
-            if os.path.isdir(docprops_dir):
-                shutil.rmtree(docprops_dir, ignore_errors=True)
-
-        # 5) Rezip with maximum compression
-        with ZipFile(output_path, "w", compression=ZIP_DEFLATED, compresslevel=9) as zout:
-            for folder, _, files in os.walk(unzip_dir):
-                for file in files:
-                    full_path = os.path.join(folder, file)
-                    rel = os.path.relpath(full_path, unzip_dir)
-                    zout.write(full_path, rel)
-
-        # 6) Safety fallback: ensure final is not larger
-        if os.path.getsize(output_path) > os.path.getsize(input_path):
-            with ZipFile(output_path, "w", compression=ZIP_DEFLATED, compresslevel=9) as zout:
-                with ZipFile(input_path, "r") as zin:
-                    for zf in zin.infolist():
-                        zout.writestr(zf.filename, zin.read(zf.filename))
-
-        return output_path
+        if header is None:
+            raise ValueError("No table detected in PDF")
 
+        report.stage("writing")
+        if fmt != "csv":
+            wb.save(out_path)
+    except Exception:
+        if fmt == "csv":
+            out.close()
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    if fmt == "csv":
+        out.close()
+    return out_path
+
+def _bold_cell(ws, value):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = Font(bold=True)
+    return cell
+
+# Layout for excel_to_pdf: font size, rows sampled to size columns, and the
+# widest a column may get (in characters) before its text is clipped.
+EXCEL_PDF_FONT_SIZE = 8
+EXCEL_PDF_SAMPLE_ROWS = 200
+EXCEL_PDF_MAX_COL_CHARS = 40
+# Width (in characters) for columns that are empty in the sampled rows
+EXCEL_PDF_DEFAULT_COL_CHARS = 10
+
+def _cell_text(value):
+    return "" if value is None else str(value).replace("\r", " ").replace("\n", " ")
+
+def _column_bands(widths, usable):
+    """
+    Group column indexes into bands that each fit the usable page width.
+    """
+    bands, band, used = [], [], 0.0
+    for i, w in enumerate(widths):
+        if band and used + w > usable:
+            bands.append(band)
+            band, used = [], 0.0
+        band.append(i)
+        used += w
+    if band:
+        bands.append(band)
+    return bands
+
+def render_workbook_pdf(in_path, out_path, report=None):
+    """
+    Render every sheet of a workbook into a paginated landscape PDF.
+    The workbook is read in read-only streaming mode. The column count comes
+    from the sheet's dimensions (counted in one streaming pass when the file
+    has none); only widths are measured from the first EXCEL_PDF_SAMPLE_ROWS
+    rows. Columns that do not fit are split into extra page bands, and each
+    page is drawn with one text object per column.
+    """
+    report = report or NULL_REPORT
+    font, size = "Helvetica", EXCEL_PDF_FONT_SIZE
+    margin = 36
+    row_h = size * 1.5
+    char_w = stringWidth("0", font, size)
+    pad = char_w
+
+    page_w, page_h = landscape(letter)
+    usable_w = page_w - 2 * margin
+    rows_per_page = max(1, int((page_h - 2 * margin - 2 * row_h) // row_h))
+
+    c = canvas.Canvas(out_path, pagesize=(page_w, page_h), pageCompression=1)
+    pages = 0
+
+    def draw_page(title, rows, cols, widths, max_chars):
+        c.setFont("Helvetica-Bold", size + 2)
+        c.drawString(margin, page_h - margin, title)
+        x = margin
+        top = page_h - margin - 2 * row_h
+        for col in cols:
+            text = c.beginText(x, top)
+            text.setFont(font, size)
+            text.setLeading(row_h)
+            for row in rows:
+                val = _cell_text(row[col]) if col < len(row) else ""
+                text.textLine(val[:max_chars[col]])
+            c.drawText(text)
+            x += widths[col]
+        c.showPage()
+
+    wb = load_workbook(in_path, read_only=True, data_only=True)
+    try:
+        for name in wb.sheetnames:
+            ws = wb[name]
+            if not hasattr(ws, "iter_rows"):
+                continue
+            report.stage(f"rendering sheet {name}")
+
+            # Columns may first appear after the sample; files written without a
+            # <dimension> get theirs counted (rows then come padded to it)
+            ws.calculate_dimension(force=True)
+            sample = list(itertools.islice(ws.iter_rows(values_only=True), EXCEL_PDF_SAMPLE_ROWS))
+            ncols = max((len(r) for r in sample), default=0)
+            if not ncols:
+                continue
+            ncols = max(ncols, ws.max_column or 0)
+            chars = [0] * ncols
+            for row in sample:
+                for i, val in enumerate(row):
+                    chars[i] = max(chars[i], len(_cell_text(val)))
+            chars = [min(n, EXCEL_PDF_MAX_COL_CHARS) if n else EXCEL_PDF_DEFAULT_COL_CHARS for n in chars]
+            widths = [min(n * char_w + pad, usable_w) for n in chars]
+            max_chars = [max(1, int(round((w - pad) / char_w))) for w in widths]
+
+            bands = _column_bands(widths, usable_w)
+            for cols in bands:
+                label = f"{name}" + (f" (columns {cols[0] + 1}-{cols[-1] + 1})" if len(bands) > 1 else "")
+                # Each band streams the sheet again rather than holding it in memory
+                rows_iter = ws.iter_rows(values_only=True)
+                page_no = 0
+                while True:
+                    rows = list(itertools.islice(rows_iter, rows_per_page))
+                    if not rows:
+                        break
+                    page_no += 1
+                    draw_page(f"{label} - page {page_no}", rows, cols, widths, max_chars)
+                    pages += 1
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        wb.close()
+
+    if not pages:
+        c.setFont(font, size)
+        c.drawString(margin, page_h - margin, "Workbook has no data")
+        c.showPage()
+    c.save()
+    return out_path
+
+# Layout for txt_to_pdf: A4 with 10 mm margins and 11 pt text, as the FPDF path used.
+TXT_PDF_FONT_SIZE = 11
+TXT_PDF_LEADING = 1.35
+TXT_PDF_MARGIN = 28.35
+TXT_PDF_TAB = "    "
+
+_txt_font = {}
+_txt_font_lock = threading.Lock()
+
+class _GlyphWidths(dict):
+    """
+    Per-character advance widths at 1 pt, measured on first use.
+    """
+    def __init__(self, font_name):
+        super().__init__()
+        self.font_name = font_name
+
+    def __missing__(self, ch):
+        w = self[ch] = stringWidth(ch, self.font_name, 1)
+        return w
+
+def _txt_pdf_font():
+    """
+    Register NotoSans-Regular.ttf (if present) once per process and return
+    (font_name, glyph widths). reportlab keeps the parsed face and subsets it
+    into each document, so the TTF is only parsed on the first request.
+    """
+    with _txt_font_lock:
+        if not _txt_font:
+            font_path = os.path.join(BASE_DIR, "NotoSans-Regular.ttf")
+            name = "Helvetica"
+            if os.path.exists(font_path):
+                pdfmetrics.registerFont(TTFont("Noto", font_path))
+                name = "Noto"
+            _txt_font["name"] = name
+            _txt_font["widths"] = _GlyphWidths(name)
+        return _txt_font["name"], _txt_font["widths"]
+
+def _wrap_text_line(line, widths, max_w):
+    """
+    Split one input line into pieces no wider than max_w (in 1 pt units),
+    breaking after the last space when possible.
+    """
+    if not line:
+        return [""]
+    pieces = []
+    start, width, last_space = 0, 0.0, -1
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        cw = widths[ch]
+        if width + cw > max_w and i > start:
+            cut = last_space + 1 if last_space >= start else i
+            pieces.append(line[start:cut])
+            start, width, last_space = cut, 0.0, -1
+            i = cut
+            continue
+        if ch == " ":
+            last_space = i
+        width += cw
+        i += 1
+    pieces.append(line[start:])
+    return pieces
+
+def render_text_pdf(in_path, out_path, report=None):
+    """
+    Lay a text file out into A4 pages. Input is streamed line by line, wrapped
+    with cached glyph widths, and each page is emitted as one text object.
+    A form feed in the input starts a new page.
+    """
+    report = report or NULL_REPORT
+    font, widths = _txt_pdf_font()
+    size = TXT_PDF_FONT_SIZE
+    leading = size * TXT_PDF_LEADING
+    page_w, page_h = A4
+    max_w = (page_w - 2 * TXT_PDF_MARGIN) / size
+    lines_per_page = max(1, int((page_h - 2 * TXT_PDF_MARGIN) // leading))
+
+    report.stage("laying out text")
+    c = canvas.Canvas(out_path, pagesize=A4, pageCompression=1)
+    batch = []
+    pages = 0
+
+    def flush():
+        nonlocal pages
+        text = c.beginText(TXT_PDF_MARGIN, page_h - TXT_PDF_MARGIN - size)
+        text.setFont(font, size)
+        text.setLeading(leading)
+        for piece in batch:
+            text.textLine(piece)
+        c.drawText(text)
+        c.showPage()
+        batch.clear()
+        pages += 1
+
+    with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.rstrip("\r\n").replace("\t", TXT_PDF_TAB)
+            for num, segment in enumerate(line.split("\f")):
+                if num:
+                    flush()
+                for piece in _wrap_text_line(segment, widths, max_w):
+                    batch.append(piece)
+                    if len(batch) >= lines_per_page:
+                        flush()
+    if batch or not pages:
+        flush()
+    c.save()
+    return out_path
+
+def render_text_pdf_fpdf(in_path, out_path, report=None):
+    """
+    Original FPDF path (one multi_cell per line). Used when reportlab is not
+    installed, and as the baseline in benchmarks/bench_txt_to_pdf.py.
+    """
+    pdf = FPDF()
+    pdf.add_page()
+
+    # Use NotoSans-Regular.ttf (must exist in project folder)
+    font_path = os.path.join(BASE_DIR, "NotoSans-Regular.ttf")
+    if os.path.exists(font_path):
+        pdf.add_font("Noto", "", font_path, uni=True)
+        pdf.set_font("Noto", size=11)
+    else:
+        pdf.set_font("Helvetica", size=11)
+
+    with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            pdf.multi_cell(0, 8, line.rstrip())
+            # fpdf2 leaves x at the right margin after multi_cell; PyFPDF already resets it
+            pdf.set_x(pdf.l_margin)
+
+    pdf.output(out_path)
+    return out_path
+
+# Processes and pages per task for parallel pdf_to_txt.
+PDF_TEXT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+PDF_TEXT_PAGES_PER_TASK = 16
+
+def pdf_page_count(in_path):
+    with open(in_path, "rb") as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp))
+
+def iter_pdf_text(in_path, page_indexes=None):
+    """
+    Yield the text of each page (0-based page_indexes, default all) in order.
+    Same output as pdfminer's extract_text, including the form feed after
+    every page, but only one page is held in memory at a time.
+    """
+    rsrcmgr = PDFResourceManager(caching=True)
+    laparams = LAParams()
+    with open(in_path, "rb") as fp:
+        for page in PDFPage.get_pages(fp, pagenos=page_indexes):
+            buf = StringIO()
+            device = TextConverter(rsrcmgr, buf, laparams=laparams)
+            try:
+                PDFPageInterpreter(rsrcmgr, device).process_page(page)
+            finally:
+                device.close()
+            yield buf.getvalue()
+
+def _extract_text_for_pages(args):
+    in_path, indexes = args
+    return "".join(iter_pdf_text(in_path, set(indexes)))
+
+def iter_pdf_text_parallel(in_path, workers=None):
+    """
+    Like iter_pdf_text, but page ranges are extracted in separate processes
+    and yielded one range at a time, in order.
+    """
+    workers = PDF_TEXT_WORKERS if workers is None else workers
+    total = pdf_page_count(in_path)
+    tasks = [(in_path, list(range(i, min(i + PDF_TEXT_PAGES_PER_TASK, total))))
+             for i in range(0, total, PDF_TEXT_PAGES_PER_TASK)]
+    if workers <= 1 or len(tasks) <= 1:
+        yield from iter_pdf_text(in_path)
+        return
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        yield from pool.imap(_extract_text_for_pages, tasks)
+
+def stream_text_download(chunks, out_path, download_name, cache_key=None):
+    """
+    Stream text chunks to the client as they are produced, teeing them into
+    out_path; the file is registered in result_cache once complete.
+    """
+    def generate():
+        part = out_path + ".part"
+        try:
+            with open(part, "w", encoding="utf-8") as f:
+                for text in chunks:
+                    f.write(text)
+                    yield text.encode("utf-8")
+            os.replace(part, out_path)
+            if cache_key:
+                result_cache.put(cache_key, out_path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+
+    return Response(generate(), mimetype="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f"attachment; filename={download_name}"})
 
 # -------------------------
 # ROUTES
@@ -439,7 +2723,7 @@ def conversion_tools():
 @app.route('/pdf_to_word', methods=['GET', 'POST'])
 def pdf_to_word():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('pdf_to_word.html', error="No file selected")
 
@@ -454,13 +2738,20 @@ def pdf_to_word():
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
+            download_name = converted_filename(uploaded.filename, ".docx")
+            key = result_cache.make_key(in_path, "pdf_to_word")
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
+
             out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".docx")
 
-            cv = Converter(in_path)
-            cv.convert(out_path)
-            cv.close()
+            if wants_async():
+                return job_accepted(start_job(convert_pdf_to_docx, (in_path, out_path), out_path, download_name, cache_key=key))
 
-            download_name = converted_filename(uploaded.filename, ".docx")
+            convert_pdf_to_docx(in_path, out_path)
+
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -474,7 +2765,7 @@ def pdf_to_word():
 @app.route('/word_to_pdf', methods=['GET', 'POST'])
 def word_to_pdf():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('word_to_pdf.html', error="No file selected")
 
@@ -489,11 +2780,17 @@ def word_to_pdf():
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
+            download_name = converted_filename(uploaded.filename, ".pdf")
+            key = result_cache.make_key(in_path, "word_to_pdf")
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
+
             out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".pdf")
 
             docx2pdf_convert(in_path, out_path)
 
-            download_name = converted_filename(uploaded.filename, ".pdf")
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -507,7 +2804,7 @@ def word_to_pdf():
 @app.route('/excel_to_pdf', methods=['GET', 'POST'])
 def excel_to_pdf():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('excel_to_pdf.html', error="No file selected")
 
@@ -517,40 +2814,28 @@ def excel_to_pdf():
         if not HAVE_OPENPYXL:
             return render_template('excel_to_pdf.html', error="openpyxl missing")
 
+        if not HAVE_REPORTLAB:
+            return render_template('excel_to_pdf.html', error="reportlab missing")
+
         try:
             unique = unique_filename(uploaded.filename)
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
-            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".pdf")
-
-            from reportlab.lib.pagesizes import letter, landscape
-            from reportlab.lib.units import inch
-            from reportlab.pdfgen import canvas
-
-            workbook = load_workbook(in_path, data_only=True)
-            sheet = workbook.active
-
-            c = canvas.Canvas(out_path, pagesize=landscape(letter))
-
-            max_row = sheet.max_row
-            max_col = sheet.max_column
-
-            width, height = landscape(letter)
-            cell_w = (width - inch) / max_col if max_col else width
-            cell_h = (height - inch) / max_row if max_row else height
+            download_name = converted_filename(uploaded.filename, ".pdf")
+            key = result_cache.make_key(in_path, "excel_to_pdf")
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
 
-            c.setFont("Helvetica", 8)
+            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".pdf")
 
-            for r in range(1, max_row + 1):
-                for col in range(1, max_col + 1):
-                    val = sheet.cell(r, col).value
-                    txt = "" if val is None else str(val)
-                    c.drawString((col - 1) * cell_w + 20, height - (r * cell_h), txt)
+            if wants_async():
+                return job_accepted(start_job(render_workbook_pdf, (in_path, out_path), out_path, download_name, cache_key=key))
 
-            c.save()
+            render_workbook_pdf(in_path, out_path)
 
-            download_name = converted_filename(uploaded.filename, ".pdf")
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -564,7 +2849,7 @@ def excel_to_pdf():
 @app.route('/pdf_to_csv', methods=['GET', 'POST'])
 def pdf_to_csv():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('pdf_to_csv.html', error="No file selected")
 
@@ -572,28 +2857,26 @@ def pdf_to_csv():
             return render_template('pdf_to_csv.html', error="Upload a PDF")
 
         try:
-            import pdfplumber
-
             unique = unique_filename(uploaded.filename)
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
-            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".csv")
+            download_name = converted_filename(uploaded.filename, ".csv")
+            pages = request.values.get("pages", "").strip()
+            key = result_cache.make_key(in_path, "pdf_to_csv", {"pages": pages or None})
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
 
-            rows = []
-            with pdfplumber.open(in_path) as pdf:
-                for page in pdf.pages:
-                    table = page.extract_table()
-                    if table:
-                        rows.extend(table)
+            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".csv")
 
-            if not rows:
-                return render_template('pdf_to_csv.html', error="No table detected in PDF")
+            if wants_async():
+                return job_accepted(start_job(convert_pdf_tables, (in_path, out_path, "csv"), out_path, download_name,
+                                              kwargs={"pages": pages}, cache_key=key))
 
-            df = pd.DataFrame(rows[1:], columns=rows[0])
-            df.to_csv(out_path, index=False)
+            convert_pdf_tables(in_path, out_path, "csv", pages=pages)
 
-            download_name = converted_filename(uploaded.filename, ".csv")
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -607,7 +2890,7 @@ def pdf_to_csv():
 @app.route('/pdf_to_excel', methods=['GET', 'POST'])
 def pdf_to_excel():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('pdf_to_excel.html', error="No file selected")
 
@@ -615,28 +2898,26 @@ def pdf_to_excel():
             return render_template('pdf_to_excel.html', error="Upload a PDF")
 
         try:
-            import pdfplumber
-
             unique = unique_filename(uploaded.filename)
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
-            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".xlsx")
+            download_name = converted_filename(uploaded.filename, ".xlsx")
+            pages = request.values.get("pages", "").strip()
+            key = result_cache.make_key(in_path, "pdf_to_excel", {"pages": pages or None})
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
 
-            rows = []
-            with pdfplumber.open(in_path) as pdf:
-                for page in pdf.pages:
-                    table = page.extract_table()
-                    if table:
-                        rows.extend(table)
+            out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".xlsx")
 
-            if not rows:
-                return render_template('pdf_to_excel.html', error="No table detected in PDF")
+            if wants_async():
+                return job_accepted(start_job(convert_pdf_tables, (in_path, out_path, "xlsx"), out_path, download_name,
+                                              kwargs={"pages": pages}, cache_key=key))
 
-            df = pd.DataFrame(rows[1:], columns=rows[0])
-            df.to_excel(out_path, index=False)
+            convert_pdf_tables(in_path, out_path, "xlsx", pages=pages)
 
-            download_name = converted_filename(uploaded.filename, ".xlsx")
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -650,7 +2931,7 @@ def pdf_to_excel():
 @app.route('/pdf_to_txt', methods=['GET', 'POST'])
 def pdf_to_txt():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('pdf_to_txt.html', error="No file selected")
 
@@ -665,14 +2946,23 @@ def pdf_to_txt():
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
+            download_name = converted_filename(uploaded.filename, ".txt")
+            key = result_cache.make_key(in_path, "pdf_to_txt")
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
+
             out_path = os.path.join(DOWNLOAD_FOLDER, os.path.splitext(unique)[0] + ".txt")
 
-            text = extract_text(in_path)
-            with open(out_path, 'w', encoding='utf-8') as f:
-                f.write(text)
+            # Open the document and pull the first chunk up front so broken
+            # PDFs still get a proper error page instead of a truncated download
+            if request.values.get("parallel") in ("1", "on", "true"):
+                chunks = iter_pdf_text_parallel(in_path)
+            else:
+                chunks = iter_pdf_text(in_path)
+            first = next(chunks, "")
 
-            download_name = converted_filename(uploaded.filename, ".txt")
-            return send_file(out_path, as_attachment=True, download_name=download_name)
+            return stream_text_download(itertools.chain([first], chunks), out_path, download_name, key)
 
         except Exception as e:
             return render_template('pdf_to_txt.html', error=str(e))
@@ -685,7 +2975,7 @@ def pdf_to_txt():
 @app.route('/txt_to_pdf', methods=['GET', 'POST'])
 def txt_to_pdf():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
+        uploaded = get_uploaded_file()
         if not uploaded or uploaded.filename == '':
             return render_template('txt_to_pdf.html', error="No file selected")
 
@@ -697,31 +2987,25 @@ def txt_to_pdf():
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
+            download_name = converted_filename(uploaded.filename, ".pdf")
+            key = result_cache.make_key(in_path, "txt_to_pdf")
+            cached = result_cache.get(key)
+            if cached:
+                return send_result(cached, download_name)
+
             out_path = os.path.join(
                 DOWNLOAD_FOLDER,
                 os.path.splitext(unique)[0] + "_converted.pdf"
             )
 
-            from fpdf import FPDF
-
-            pdf = FPDF()
-            pdf.add_page()
-
-            # Use NotoSans-Regular.ttf (must exist in project folder)
-            font_path = os.path.join(BASE_DIR, "NotoSans-Regular.ttf")
-            if os.path.exists(font_path):
-                pdf.add_font("Noto", "", font_path, uni=True)
-                pdf.set_font("Noto", size=11)
+            if HAVE_REPORTLAB:
+                render_text_pdf(in_path, out_path)
+            elif HAVE_FPDF:
+                render_text_pdf_fpdf(in_path, out_path)
             else:
-                pdf.set_font("Helvetica", size=11)
-
-            with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    pdf.multi_cell(0, 8, line.rstrip())
+                return render_template('txt_to_pdf.html', error="reportlab or fpdf required")
 
-            pdf.output(out_path)
-
-            download_name = converted_filename(uploaded.filename, ".pdf")
+            result_cache.put(key, out_path)
             return send_file(out_path, as_attachment=True, download_name=download_name)
 
         except Exception as e:
@@ -732,50 +3016,134 @@ def txt_to_pdf():
 # --------------------
 # IMAGE COMPRESSION
 # --------------------
+def render_image_page(**context):
+    # Only formats this Pillow build can write are offered
+    return render_template('image_compression.html', formats=IMAGE_OUTPUT_FORMATS, **context)
+
 @app.route('/image_compression', methods=['GET', 'POST'])
 def image_compression():
     if request.method == 'POST':
-        uploaded = request.files.get('file')
-        quality = request.form.get('quality', type=int)
+        quality = request.form.get('quality', 75, type=int)
+        target_kb = request.form.get('target_kb', type=int)
+        target_ratio = request.form.get('target_ratio', type=int)
+        fmt = request.form.get('format', 'jpeg').lower()
+        if fmt != "auto" and fmt not in IMAGE_OUTPUT_FORMATS:
+            return render_image_page(error=f"Output format {fmt} is not available")
+
+        # Several files, or a zip of images, go through the batch path
+        files = [f for f in request.files.getlist("file") if f and f.filename]
+        files += [claim_upload(u) for u in request.values.getlist("upload_id")]
+        files = [f for f in files if f]
+        if len(files) > 1 or (files and files[0].filename.lower().endswith(".zip")):
+            options = {"quality": quality, "target_kb": target_kb, "target_ratio": target_ratio, "fmt": fmt}
+            return image_compression_batch(files, options)
+        uploaded = files[0] if files else None
 
         if not uploaded or uploaded.filename == '':
-            return render_template('image_compression.html', error="No file selected")
+            return render_image_page(error="No file selected")
 
         ext = uploaded.filename.rsplit('.', 1)[1].lower()
         if ext not in {'jpg', 'jpeg', 'png'}:
-            return render_template('image_compression.html', error="Please upload JPG, JPEG, or PNG")
+            return render_image_page(error="Please upload JPG, JPEG, or PNG")
 
         try:
             if not HAVE_PIL:
-                return render_template('image_compression.html', error="Pillow not installed")
+                return render_image_page(error="Pillow not installed")
 
             unique = unique_filename(uploaded.filename)
             in_path = os.path.join(UPLOAD_FOLDER, unique)
             uploaded.save(in_path)
 
+            key = result_cache.make_key(in_path, "image_compression",
+                                        {"quality": quality, "target_kb": target_kb,
+                                         "target_ratio": target_ratio, "format": fmt})
+            cached = result_cache.get(key)
+            if cached:
+                # "auto" only knows its format once encoded: take it from the cached file
+                return send_result(cached, converted_filename(uploaded.filename, os.path.splitext(cached)[1]))
+
+            with open(in_path, "rb") as f:
+                fmt, data, summary = compress_image_data(f.read(), quality, target_kb, target_ratio, fmt)
+
+            ext = IMAGE_OUTPUT_FORMATS[fmt]
+            download_name = converted_filename(uploaded.filename, ext)
             out_path = os.path.join(
                 DOWNLOAD_FOLDER,
-                os.path.splitext(unique)[0] + "_converted.jpg"
+                os.path.splitext(unique)[0] + "_converted" + ext
             )
 
-            img = Image.open(in_path).convert("RGB")
-            img.save(out_path, "JPEG", optimize=True, quality=quality)
-
-            original_size = os.path.getsize(in_path)
-            compressed_size = os.path.getsize(out_path)
+            with open(out_path, "wb") as f:
+                f.write(data)
 
-            while compressed_size > original_size and quality > 10:
-                quality -= 5
-                img.save(out_path, "JPEG", optimize=True, quality=quality)
-                compressed_size = os.path.getsize(out_path)
-
-            download_name = converted_filename(uploaded.filename, ".jpg")
-            return send_file(out_path, as_attachment=True, download_name=download_name)
+            result_cache.put(key, out_path)
+            # X-Compression-Report says whether the size target was actually met
+            return with_summary_header(send_file(out_path, as_attachment=True, download_name=download_name), summary)
 
         except Exception as e:
-            return render_template('image_compression.html', error=f"Compression failed: {e}")
+            return render_image_page(error=f"Compression failed: {e}")
 
-    return render_template('image_compression.html')
+    return render_image_page()
+
+def image_compression_batch(files, options):
+    """
+    Compress many images (uploaded directly or inside zips) across a process
+    pool and stream the results back as a zip, each entry as it finishes.
+    """
+    if not HAVE_PIL:
+        return render_image_page(error="Pillow not installed")
+
+    entries = []
+
+    def add(filename, path, member=None):
+        base, _ = os.path.splitext(secure_filename(os.path.basename(filename)) or "image")
+        entries.append((base, path, member, options))
+
+    for f in files:
+        ext = f.filename.rsplit('.', 1)[-1].lower()
+        if ext != "zip" and ext not in IMAGE_EXTENSIONS:
+            continue
+        path = os.path.join(UPLOAD_FOLDER, unique_filename(f.filename))
+        f.save(path)
+        if ext != "zip":
+            add(f.filename, path)
+            continue
+        try:
+            with ZipFile(path) as z:
+                for info in z.infolist():
+                    if not info.is_dir() and info.filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS:
+                        add(info.filename, path, info.filename)
+        except zipfile.BadZipFile:
+            return render_image_page(error=f"{f.filename} is not a valid zip")
+
+    if not entries:
+        return render_image_page(error="No JPG, JPEG or PNG images found")
+
+    # Without an explicit target the budget is just the original size: not a target to report on
+    has_target = bool(options.get("target_kb") or options.get("target_ratio"))
+
+    def members():
+        errors = []
+        seen = set()
+        for base, fmt, data, summary, error in iter_compressed_images(entries):
+            if data is None:
+                errors.append(f"{base}: {error}")
+                continue
+            if has_target and not summary["target_met"]:
+                errors.append(f"{base}: size target not met ({summary['output_bytes']} bytes, "
+                              f"budget {summary['budget_bytes']}, quality {summary['quality']})")
+            arcname = f"{base}_converted{IMAGE_OUTPUT_FORMATS[fmt]}"
+            n = 1
+            while arcname in seen:
+                n += 1
+                arcname = f"{base}_converted_{n}{IMAGE_OUTPUT_FORMATS[fmt]}"
+            seen.add(arcname)
+            yield arcname, data
+        if errors:
+            yield "errors.txt", "\n".join(errors) + "\n"
+
+    # The encoded images barely deflate, so store them
+    return Response(stream_zip(members(), zipfile.ZIP_STORED), mimetype="application/zip",
+                    headers={"Content-Disposition": 'attachment; filename="images_compressed.zip"'})
 
 # --------------------
 # VIDEO COMPRESSION
@@ -783,11 +3151,22 @@ def image_compression():
 @app.route("/video_compression", methods=["GET", "POST"])
 def video_compression():
     if request.method == "POST":
-        file = request.files.get("file")
+        file = get_uploaded_file()
         user_quality = int(request.form.get("quality", 70))
+        mode = request.form.get("mode", "vbr")
+        speed = request.form.get("speed", "balanced")
+        target_mb = request.form.get("target_mb", type=float)
+        engine = request.form.get("engine", "auto")
+        reencode = request.form.get("reencode") == "1"
 
         if not file or file.filename == "":
             return render_template("video_compression.html", error="No file selected")
+        if mode not in VIDEO_MODES:
+            return render_template("video_compression.html", error="Unknown rate control mode")
+        if mode == "size" and not target_mb:
+            return render_template("video_compression.html", error="Enter a target size in MB")
+        if engine not in VIDEO_ENGINES:
+            return render_template("video_compression.html", error="Unknown encoding engine")
 
         input_name = unique_filename(file.filename)
         input_path = os.path.join(UPLOAD_FOLDER, input_name)
@@ -800,52 +3179,128 @@ def video_compression():
         input_abs = os.path.abspath(input_path)
         output_abs = os.path.abspath(output_path)
 
-        probe_cmd = [FFMPEG_PATH, "-i", input_abs]
-        probe = subprocess.run(probe_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True).stderr
-
-        match = re.search(r"bitrate:\s*(\d+)\s*kb/s", probe)
-        original_bitrate = int(match.group(1)) if match else 2000
+        job_id = uuid.uuid4().hex
+        key = result_cache.make_key(input_abs, "video_compression", {"quality": user_quality, "mode": mode,
+                                                                     "speed": speed, "target_mb": target_mb,
+                                                                     "engine": engine, "reencode": reencode})
+        cached = result_cache.get(key)
+        if cached:
+            progress_store.update(job_id, _done_record(cached, converted_filename(file.filename, ".mp4")))
+            return render_template("video_progress.html", job_id=job_id,
+                                   output_name=converted_filename(file.filename, ".mp4"))
+
+        # One ffprobe per upload; ffmpeg_monitor reuses the cached result
+        info = probe_media(input_abs)
+        try:
+            plan = plan_video(info, mode, user_quality, target_mb)
+        except ValueError as e:
+            return render_template("video_compression.html", error=str(e))
+        if reencode and plan["action"] != "full":
+            plan = {"action": "full", "label": VIDEO_PLANS["full"], "reason": "re-encode requested"}
+        output_name = converted_filename(file.filename, ".mp4")
+
+        # Mark the job queued (with the plan, so it shows before any work
+        # starts) before submitting so the job's first write wins
+        progress_store.update(job_id, {"status": "queued", "percent": 0, "plan": plan})
+        if plan["action"] != "full":
+            passes = build_copy_pass(input_abs, output_abs, info, copy_audio=plan["action"] == "remux")
+            video_jobs.submit(job_id, ffmpeg_monitor, (input_abs, output_abs, job_id, passes, key,
+                                                       {"mode": mode, "plan": plan}), priority=VIDEO_PRIORITY_COPY)
+            return render_template("video_progress.html", job_id=job_id, output_name=output_name, plan=plan)
+
+        if video_engine(engine, info) == "segments":
+            video_jobs.submit(job_id, segmented_encode, (input_abs, output_abs, job_id, mode, user_quality, speed,
+                                                         target_mb, key, {"plan": plan}), priority=VIDEO_PRIORITY_ENCODE)
+            return render_template("video_progress.html", job_id=job_id, output_name=output_name, plan=plan)
+
+        passlog_dir = tempfile.mkdtemp(prefix="x264pass_") if mode == "size" else None
+        try:
+            passes, details = build_video_passes(input_abs, output_abs, info, mode, user_quality, speed, target_mb,
+                                                 passlog=passlog_dir and os.path.join(passlog_dir, "pass"))
+        except ValueError as e:
+            if passlog_dir:
+                shutil.rmtree(passlog_dir, ignore_errors=True)
+            progress_store.update(job_id, {"status": "failed", "error": str(e)}, force=True)
+            return render_template("video_compression.html", error=str(e))
 
-        target_bitrate = int(original_bitrate * (user_quality / 100))
-        target_bitrate = max(target_bitrate, 300)
+        details["plan"] = plan
+        video_jobs.submit(job_id, ffmpeg_monitor, (input_abs, output_abs, job_id, passes, key, details, passlog_dir),
+                          priority=VIDEO_PRIORITY_ENCODE)
 
-        ffmpeg_args = [
-            FFMPEG_PATH,
-            "-i", input_abs,
-            "-b:v", f"{target_bitrate}k",
-            "-b:a", "64k",
-            "-preset", "medium",
-            "-y",
-            output_abs
-        ]
+        return render_template("video_progress.html", job_id=job_id, output_name=output_name, plan=plan)
 
-        job_id = uuid.uuid4().hex
-        thread = threading.Thread(target=ffmpeg_monitor, args=(input_abs, output_abs, job_id, ffmpeg_args), daemon=True)
-        thread.start()
+    return render_template("video_compression.html")
 
-        return render_template("video_progress.html", job_id=job_id,
-                               output_name=converted_filename(file.filename, ".mp4"))
+def _progress_payload(job_id, data):
+    if data.get("status") == "queued":
+        pos = video_jobs.position(job_id)
+        data["position"] = pos if pos is not None else converter_jobs.position(job_id)
+    if data.get("status") == "done" and data.get("output"):
+        data["download_url"] = f"/jobs/{job_id}/download"
+    return data
+
+def _job_status_response(job_id):
+    data = progress_store.get(job_id)
+    if data is None:
+        return jsonify({"status": "notfound"}), 404
+    return jsonify(_progress_payload(job_id, data))
 
-    return render_template("video_compression.html")
+def _job_events_response(job_id):
+    """
+    Server-Sent Events feed of a job's progress; ends once the job finishes.
+    """
+    def generate():
+        version = -1
+        while True:
+            # The timeout doubles as a heartbeat and refreshes queue positions
+            data, version = progress_store.wait(job_id, version, timeout=2)
+            if data is None:
+                yield "event: notfound\ndata: {}\n\n"
+                return
+            yield f"data: {json.dumps(_progress_payload(job_id, data))}\n\n"
+            if data.get("status") in FINISHED_STATES:
+                return
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/video_progress")
 def video_progress():
     job_id = request.args.get("job_id")
     if not job_id:
         return jsonify({"error": "job_id required"}), 400
+    return _job_status_response(job_id)
+
+@app.route("/video_progress_stream")
+def video_progress_stream():
+    job_id = request.args.get("job_id")
+    if not job_id:
+        return jsonify({"error": "job_id required"}), 400
+    return _job_events_response(job_id)
 
-    progress_path = os.path.join(PROGRESS_FOLDER, f"{job_id}.json")
-    if not os.path.exists(progress_path):
+# -------------------------
+# JOBS (any tool submitted with async=1, and video)
+# -------------------------
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    return _job_status_response(job_id)
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    return _job_events_response(job_id)
+
+@app.route("/jobs/<job_id>/download")
+def job_download(job_id):
+    data = progress_store.get(job_id)
+    if data is None:
         return jsonify({"status": "notfound"}), 404
+    if data.get("status") != "done":
+        return jsonify({"status": data.get("status"), "error": "job not finished"}), 409
 
-    try:
-        with open(progress_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if data.get("status") == "done" and data.get("output"):
-            data["download_url"] = "/download_by_path?path=" + data["output"]
-        return jsonify(data)
-    except Exception as e:
-        return jsonify({"status": "error", "error": str(e)}), 500
+    path = os.path.abspath(data["output"])
+    if not path.startswith(os.path.abspath(DOWNLOAD_FOLDER) + os.sep) or not os.path.exists(path):
+        return "not found", 404
+    return send_file(path, as_attachment=True, download_name=data.get("download_name") or os.path.basename(path))
 
 from urllib.parse import unquote
 
@@ -868,37 +3323,169 @@ def download_by_path():
 # ---------------------------------------------------
 # COMPRESS PDF (keeps existing ghostscript-based behavior)
 # ---------------------------------------------------
-def compress_pdf_with_ghostscript(input_path, output_path, quality='ebook'):
+# Page-range engine: ranges of PDF_GS_PAGES_PER_RANGE pages run as separate gs
+# processes, at most PDF_GS_WORKERS at a time. "auto" only splits documents of
+# at least PDF_GS_PARALLEL_MIN_PAGES pages with no outline, links or forms to
+# lose in the merge. PDF_GS_RENDER_THREADS, if set, is passed as
+# -dNumRenderingThreads (helps image-heavy pages).
+PDF_GS_WORKERS = max(1, os.cpu_count() or 1)
+PDF_GS_PAGES_PER_RANGE = 50
+PDF_GS_PARALLEL_MIN_PAGES = 100
+PDF_GS_RENDER_THREADS = None
+PDF_GS_QUALITIES = ("screen", "ebook", "printer", "prepress")
+
+_gs_bin = []
+
+def ghostscript_binary():
     """
-    Uses Ghostscript to compress PDF.
-    quality: one of screen, ebook, printer, prepress
-    Requires ghostscript (gs) available on PATH
+    Path of the Ghostscript executable, looked up once per process.
     """
-    gs_bin = shutil.which("gs") or shutil.which("gswin64c") or shutil.which("gswin32c")
-    if not gs_bin:
-        raise RuntimeError("Ghostscript not found on PATH (gs or gswin64c)")
-
-    gs_cmd = [
-        gs_bin,
+    if not _gs_bin:
+        found = shutil.which("gs") or shutil.which("gswin64c") or shutil.which("gswin32c")
+        if not found:
+            raise RuntimeError("Ghostscript not found on PATH (gs or gswin64c)")
+        _gs_bin.append(found)
+    return _gs_bin[0]
+
+def _gs_command(input_path, output, quality, first_page=None, last_page=None, render_threads=None):
+    if quality not in PDF_GS_QUALITIES:
+        raise ValueError(f"Unknown PDF quality: {quality}")
+    cmd = [
+        ghostscript_binary(),
         "-sDEVICE=pdfwrite",
         "-dCompatibilityLevel=1.4",
         "-dPDFSETTINGS=/" + quality,
         "-dNOPAUSE",
         "-dQUIET",
         "-dBATCH",
-        f"-sOutputFile={output_path}",
-        input_path
     ]
-    proc = subprocess.run(gs_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if render_threads:
+        cmd.append(f"-dNumRenderingThreads={int(render_threads)}")
+    if first_page:
+        cmd += [f"-dFirstPage={first_page}", f"-dLastPage={last_page}"]
+    if output == "-":
+        # PDF goes to stdout; keep gs messages out of it
+        cmd.append("-sstdout=%stderr")
+    cmd += [f"-sOutputFile={output}", input_path]
+    return cmd
+
+def _run_gs(cmd):
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if proc.returncode != 0:
-        raise RuntimeError(f"Ghostscript failed: {proc.stderr.strip()}")
+        raise RuntimeError(f"Ghostscript failed: {proc.stderr.decode(errors='replace').strip()}")
+    return proc.stdout
+
+def compress_pdf_with_ghostscript(input_path, output_path, quality='ebook', report=None, render_threads=None):
+    """
+    Uses Ghostscript to compress PDF.
+    quality: one of screen, ebook, printer, prepress
+    Requires ghostscript (gs) available on PATH
+    """
+    report = report or NULL_REPORT
+    started = time.monotonic()
+    report.stage("ghostscript")
+    render_threads = PDF_GS_RENDER_THREADS if render_threads is None else render_threads
+    _run_gs(_gs_command(input_path, output_path, quality, render_threads=render_threads))
+    report.summary({"engine": "single", "input_bytes": os.path.getsize(input_path),
+                    "output_bytes": os.path.getsize(output_path),
+                    "seconds": round(time.monotonic() - started, 4)})
     return output_path
 
+def compress_pdf_page_ranges(input_path, output_path, quality='ebook', report=None, render_threads=None,
+                             workers=None, pages_per_range=None, reader=None):
+    """
+    Compress a PDF as concurrent Ghostscript runs over page ranges, each
+    writing its PDF to a pipe, then merge the pieces in order with pypdf.
+    Resources repeated across ranges (fonts, shared images) are deduplicated
+    on merge; document-level outline, links and forms are not carried over
+    (see pdf_needs_single_run). reader: an already open PdfReader of input_path.
+    """
+    if not HAVE_PYPDF:
+        raise RuntimeError("pypdf is required for page-range PDF compression")
+    report = report or NULL_REPORT
+    workers = PDF_GS_WORKERS if workers is None else workers
+    pages_per_range = pages_per_range or PDF_GS_PAGES_PER_RANGE
+    render_threads = PDF_GS_RENDER_THREADS if render_threads is None else render_threads
+    started = time.monotonic()
+
+    pages = len((reader or PdfReader(input_path)).pages)
+    ranges = [(first, min(first + pages_per_range - 1, pages)) for first in range(1, pages + 1, pages_per_range)]
+    done = []
+
+    def run(page_range):
+        first, last = page_range
+        range_started = time.monotonic()
+        data = _run_gs(_gs_command(input_path, "-", quality, first, last, render_threads))
+        done.append(last - first + 1)
+        report.page(sum(done), pages)
+        return {"first_page": first, "last_page": last, "bytes": len(data),
+                "seconds": round(time.monotonic() - range_started, 4)}, data
+
+    report.stage("ghostscript")
+    with multiprocessing.pool.ThreadPool(max(1, min(workers, len(ranges)))) as pool:
+        results = pool.map(run, ranges)
+
+    report.stage("merging")
+    merge_started = time.monotonic()
+    writer = PdfWriter()
+    for _, data in results:
+        writer.append(PdfReader(BytesIO(data)))
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    with open(output_path, "wb") as f:
+        writer.write(f)
+
+    report.summary({"engine": "parallel", "pages": pages, "workers": min(workers, len(ranges)),
+                    "input_bytes": os.path.getsize(input_path), "output_bytes": os.path.getsize(output_path),
+                    "seconds": round(time.monotonic() - started, 4),
+                    "merge_seconds": round(time.monotonic() - merge_started, 4),
+                    "ranges": [info for info, _ in results]})
+    return output_path
+
+def pdf_needs_single_run(reader):
+    """
+    True if the document has anything the page-range merge would lose: an
+    outline, named destinations, form fields or link annotations.
+    """
+    root = reader.trailer["/Root"]
+    outlines = root.get("/Outlines")
+    if outlines is not None and "/First" in outlines.get_object():
+        return True
+    names = root.get("/Names")
+    if "/AcroForm" in root or "/Dests" in root or (names is not None and "/Dests" in names.get_object()):
+        return True
+    for page in reader.pages:
+        for annot in page.get("/Annots") or []:
+            if annot.get_object().get("/Subtype") == "/Link":
+                return True
+    return False
+
+def compress_pdf_file(input_path, output_path, quality='ebook', engine="auto", report=None, render_threads=None):
+    """
+    engine: "single" (one gs process), "parallel" (page ranges) or "auto",
+    which goes parallel for long documents when there is more than one worker
+    and nothing document-level would be lost by splitting them.
+    """
+    reader = None
+    if engine == "auto":
+        engine = "single"
+        if HAVE_PYPDF and PDF_GS_WORKERS > 1:
+            try:
+                reader = PdfReader(input_path)
+                if len(reader.pages) >= PDF_GS_PARALLEL_MIN_PAGES and not pdf_needs_single_run(reader):
+                    engine = "parallel"
+            except Exception:
+                pass  # let Ghostscript report what is wrong with the file
+    if engine == "parallel":
+        return compress_pdf_page_ranges(input_path, output_path, quality, report, render_threads, reader=reader)
+    return compress_pdf_with_ghostscript(input_path, output_path, quality, report, render_threads)
+
 @app.route('/compress_pdf', methods=['GET', 'POST'])
 def compress_pdf():
     if request.method == 'POST':
-        file = request.files.get("file")
+        file = get_uploaded_file()
         level = request.form.get("level", "ebook")
+        engine = request.form.get("engine", "auto")
+        render_threads = request.form.get("render_threads", type=int)
 
         if not file or file.filename == "":
             return render_template("tool_page.html", title="Compress PDF",
@@ -917,13 +3504,27 @@ def compress_pdf():
         input_path = os.path.join(UPLOAD_FOLDER, unique)
         file.save(input_path)
 
+        download_name = converted_filename(file.filename, ".pdf")
+        key = result_cache.make_key(input_path, "compress_pdf", {"level": level, "engine": engine})
+        cached = result_cache.get(key)
+        if cached:
+            return send_result(cached, download_name)
+
         out_name = unique.replace(".pdf", "_compressed.pdf")
         output_path = os.path.join(DOWNLOAD_FOLDER, out_name)
 
+        if wants_async():
+            return job_accepted(start_job(compress_pdf_file, (input_path, output_path), output_path, download_name,
+                                          kwargs={"quality": level, "engine": engine,
+                                                  "render_threads": render_threads}, cache_key=key))
+
         try:
-            compress_pdf_with_ghostscript(input_path, output_path, quality=level)
-            return send_file(output_path, as_attachment=True,
-                             download_name=converted_filename(file.filename, ".pdf"))
+            summary = SummaryReporter()
+            compress_pdf_file(input_path, output_path, quality=level, engine=engine,
+                              report=summary, render_threads=render_threads)
+            result_cache.put(key, output_path)
+            return with_summary_header(send_file(output_path, as_attachment=True, download_name=download_name),
+                                       summary.summary_data)
         except Exception as e:
             return render_template("tool_page.html", title="Compress PDF",
                                    subtitle="Reduce PDF size",
@@ -942,9 +3543,10 @@ def compress_pdf():
 @app.route('/compress_word', methods=['GET', 'POST'])
 def compress_word_route():
     if request.method == 'POST':
-        file = request.files.get("file")
+        file = get_uploaded_file()
         quality = int(request.form.get("quality", 70))
         maxwidth = int(request.form.get("maxwidth", 1600))
+        perceptual = bool(request.form.get("perceptual_dedupe"))
 
         if not file or file.filename == "":
             return render_template("word_compression.html", error="No file selected")
@@ -957,13 +3559,28 @@ def compress_word_route():
         input_path = os.path.join(UPLOAD_FOLDER, unique)
         file.save(input_path)
 
+        download_name = converted_filename(file.filename, ".docx")
+        key = result_cache.make_key(input_path, "compress_word", {"quality": quality, "maxwidth": maxwidth,
+                                                             "perceptual": perceptual})
+        cached = result_cache.get(key)
+        if cached:
+            return send_result(cached, download_name)
+
         out_name = os.path.splitext(unique)[0] + "_compressed.docx"
         output_path = os.path.join(DOWNLOAD_FOLDER, out_name)
 
+        if wants_async():
+            return job_accepted(start_job(compress_docx_file, (input_path, output_path), output_path, download_name,
+                                          kwargs={"image_max_width": maxwidth, "image_quality": quality,
+                                                  "perceptual_dedupe": perceptual}, cache_key=key))
+
         try:
-            compress_docx_file(input_path, output_path, image_max_width=maxwidth, image_quality=quality)
-            return send_file(output_path, as_attachment=True,
-                             download_name=converted_filename(file.filename, ".docx"))
+            summary = SummaryReporter()
+            compress_docx_file(input_path, output_path, image_max_width=maxwidth, image_quality=quality,
+                               perceptual_dedupe=perceptual, report=summary)
+            result_cache.put(key, output_path)
+            return with_summary_header(send_file(output_path, as_attachment=True, download_name=download_name),
+                                       summary.summary_data)
         except Exception as e:
             return render_template("word_compression.html", error=f"Compression failed: {e}")
 
@@ -975,9 +3592,10 @@ def compress_word_route():
 @app.route('/compress_ppt', methods=['GET', 'POST'])
 def compress_ppt_route():
     if request.method == 'POST':
-        file = request.files.get("file")
+        file = get_uploaded_file()
         quality = int(request.form.get("quality", 70))
         maxwidth = int(request.form.get("maxwidth", 1600))
+        perceptual = bool(request.form.get("perceptual_dedupe"))
 
         if not file or file.filename == "":
             return render_template("ppt_compression.html", error="No file selected")
@@ -990,15 +3608,31 @@ def compress_ppt_route():
         input_path = os.path.join(UPLOAD_FOLDER, unique)
         file.save(input_path)
 
+        download_name = converted_filename(file.filename, ".pptx")
+        key = result_cache.make_key(input_path, "compress_ppt", {"quality": quality, "maxwidth": maxwidth,
+                                                             "perceptual": perceptual})
+        cached = result_cache.get(key)
+        if cached:
+            return send_result(cached, download_name)
+
         out_name = os.path.splitext(unique)[0] + "_compressed.pptx"
         output_path = os.path.join(DOWNLOAD_FOLDER, out_name)
 
+        if wants_async():
+            return job_accepted(start_job(compress_pptx_file, (input_path, output_path), output_path, download_name,
+                                          kwargs={"image_max_width": maxwidth, "image_quality": quality,
+                                                  "perceptual_dedupe": perceptual}, cache_key=key))
+
         try:
+            summary = SummaryReporter()
             compress_pptx_file(input_path, output_path,
                                image_max_width=maxwidth,
-                               image_quality=quality)
-            return send_file(output_path, as_attachment=True,
-                             download_name=converted_filename(file.filename, ".pptx"))
+                               image_quality=quality,
+                               perceptual_dedupe=perceptual,
+                               report=summary)
+            result_cache.put(key, output_path)
+            return with_summary_header(send_file(output_path, as_attachment=True, download_name=download_name),
+                                       summary.summary_data)
         except Exception as e:
             return render_template("ppt_compression.html", error=f"Compression failed: {e}")
 
@@ -1010,7 +3644,7 @@ def compress_ppt_route():
 @app.route('/compress_excel', methods=['GET', 'POST'])
 def compress_excel_route():
     if request.method == 'POST':
-        file = request.files.get("file")
+        file = get_uploaded_file()
         quality = int(request.form.get("quality", 70))
         maxwidth = int(request.form.get("maxwidth", 1600))
         flatten = request.form.get("flatten", "on") == "on"
@@ -1026,16 +3660,30 @@ def compress_excel_route():
         input_path = os.path.join(UPLOAD_FOLDER, unique)
         file.save(input_path)
 
+        download_name = converted_filename(file.filename, ".xlsx")
+        key = result_cache.make_key(input_path, "compress_excel", {"quality": quality, "maxwidth": maxwidth, "flatten": flatten})
+        cached = result_cache.get(key)
+        if cached:
+            return send_result(cached, download_name)
+
         out_name = os.path.splitext(unique)[0] + "_compressed.xlsx"
         output_path = os.path.join(DOWNLOAD_FOLDER, out_name)
 
+        if wants_async():
+            return job_accepted(start_job(compress_xlsx_file, (input_path, output_path), output_path, download_name,
+                                          kwargs={"image_max_width": maxwidth, "image_quality": quality,
+                                                  "flatten_formulas": flatten}, cache_key=key))
+
         try:
+            summary = SummaryReporter()
             compress_xlsx_file(input_path, output_path,
                                image_max_width=maxwidth,
                                image_quality=quality,
-                               flatten_formulas=flatten)
-            return send_file(output_path, as_attachment=True,
-                             download_name=converted_filename(file.filename, ".xlsx"))
+                               flatten_formulas=flatten,
+                               report=summary)
+            result_cache.put(key, output_path)
+            return with_summary_header(send_file(output_path, as_attachment=True, download_name=download_name),
+                                       summary.summary_data)
         except Exception as e:
             return render_template("excel_compression.html", error=f"Compression failed: {e}")
 
@@ -1044,34 +3692,156 @@ def compress_excel_route():
 # ---------------------------------------------------
 # CREATE ZIP (keeps existing behavior)
 # ---------------------------------------------------
+def render_zip_page(**context):
+    """
+    The create_zip form, with the preset picker kept on what was submitted.
+    """
+    return render_template("tool_page.html", title="Create ZIP",
+                           subtitle="Bundle multiple files",
+                           accepted_formats="Any",
+                           presets=list(ZIP_PRESETS),
+                           preset=request.form.get("preset", ZIP_DEFAULT_PRESET),
+                           **context)
+
 @app.route('/create_zip', methods=['GET', 'POST'])
 def create_zip():
     if request.method == 'POST':
         files = request.files.getlist("file")
+        files += [claim_upload(u) for u in request.values.getlist("upload_id")]
 
         if not files:
-            return render_template("tool_page.html", title="Create ZIP",
-                                   subtitle="Bundle multiple files",
-                                   error="No files selected",
-                                   accepted_formats="Any")
+            return render_zip_page(error="No files selected")
 
-        zip_name = f"bundle_{uuid.uuid4().hex}.zip"
-        zip_path = os.path.join(DOWNLOAD_FOLDER, zip_name)
+        files = [f for f in files if f and f.filename != ""]
+        if not files:
+            return render_zip_page(error="No files selected")
+
+        preset = ZIP_PRESETS.get(request.form.get("preset", ZIP_DEFAULT_PRESET))
+        if preset is None:
+            return render_zip_page(error="Unknown compression preset")
+        level = request.form.get("level", type=int)
+        if level is None:
+            level = preset["level"]
+        elif preset["levels"] is None:
+            return render_zip_page(error="This preset does not take a compression level")
+        elif level not in preset["levels"]:
+            levels = preset["levels"]
+            return render_zip_page(error=f"Compression level must be {levels[0]}-{levels[-1]} for this preset")
+
+        # Flask closes the request's files when the view returns, before a
+        # streamed body is sent: take the upload streams away from the request
+        sources = []
+        for f in files:
+            if isinstance(f, ChunkedUpload):
+                sources.append((f.filename, f.open(), f))
+            else:
+                sources.append((f.filename, f.stream, None))
+                f.stream = BytesIO()
 
-        with ZipFile(zip_path, "w", ZIP_DEFLATED) as z:
-            for f in files:
-                if not f or f.filename == "":
-                    continue
-                unique = unique_filename(f.filename)
-                saved_path = os.path.join(UPLOAD_FOLDER, unique)
-                f.save(saved_path)
-                z.write(saved_path, arcname=secure_filename(f.filename))
+        def members():
+            # Each upload is compressed (or stored) straight into the response:
+            # nothing is copied to UPLOAD_FOLDER and no archive is built on disk
+            try:
+                for filename, stream, chunked in sources:
+                    arcname = secure_filename(filename)
+                    with stream:
+                        if preset["format"] == "tar.zst":
+                            size = stream.seek(0, os.SEEK_END)
+                            stream.seek(0)
+                            yield arcname, stream, size
+                        else:
+                            zinfo = zipfile.ZipInfo(arcname, time.localtime()[:6])
+                            zinfo.external_attr = 0o644 << 16
+                            ext = arcname.rsplit(".", 1)[-1].lower()
+                            zinfo.compress_type = zipfile.ZIP_STORED if ext in ZIP_STORED_EXTENSIONS \
+                                else preset["compression"]
+                            yield zinfo, stream
+                    if chunked:
+                        chunked.discard()
+            finally:
+                # A dropped connection stops the generator early: close and remove the rest
+                for _, stream, chunked in sources:
+                    stream.close()
+                    if chunked:
+                        chunked.discard()
+
+        if preset["format"] == "tar.zst":
+            return Response(stream_tar_zst(members(), level), mimetype="application/zstd",
+                            headers={"Content-Disposition": 'attachment; filename="bundle.tar.zst"'})
+        return Response(stream_zip(members(), preset["compression"], level, ZIP_WORKERS), mimetype="application/zip",
+                        headers={"Content-Disposition": 'attachment; filename="bundle.zip"'})
+
+    return render_zip_page()
 
-        return send_file(zip_path, as_attachment=True, download_name="bundle.zip")
+# -------------------------
+# CHUNKED UPLOADS
+# -------------------------
+@app.route("/uploads", methods=["POST"])
+def upload_create():
+    """
+    Start a chunked upload. Params: filename, optional size (bytes).
+    """
+    params = request.get_json(silent=True) or request.values
+    filename = params.get("filename", "")
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "unsupported or missing filename"}), 400
+    try:
+        size = int(params["size"]) if params.get("size") not in (None, "") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be an integer"}), 400
 
-    return render_template("tool_page.html", title="Create ZIP",
-                           subtitle="Bundle multiple files",
-                           accepted_formats="Any")
+    upload_id = chunked_uploads.create(filename, size)
+    info = chunked_uploads.info(upload_id)
+    info["max_chunk"] = UPLOAD_MAX_CHUNK
+    return jsonify(info), 201
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """
+    Current offset of an upload; clients resume from here after a drop.
+    """
+    info = chunked_uploads.info(upload_id)
+    if not info:
+        return jsonify({"status": "notfound"}), 404
+    return jsonify(info)
+
+@app.route("/uploads/<upload_id>", methods=["PUT", "PATCH"])
+def upload_chunk(upload_id):
+    """
+    Write the raw request body at ?offset=N. Optional X-Chunk-SHA256 header
+    carries the hex SHA-256 of the chunk.
+    """
+    offset = request.args.get("offset", type=int)
+    length = request.content_length
+    if offset is None or length is None:
+        return jsonify({"error": "offset and Content-Length required"}), 400
+    if length > UPLOAD_MAX_CHUNK:
+        return jsonify({"error": f"chunk larger than {UPLOAD_MAX_CHUNK} bytes"}), 413
+
+    try:
+        new_offset = chunked_uploads.write_chunk(upload_id, offset, request.stream, length,
+                                                 request.headers.get("X-Chunk-SHA256"))
+    except KeyError:
+        return jsonify({"status": "notfound"}), 404
+    except ValueError as e:
+        info = chunked_uploads.info(upload_id)
+        return jsonify({"error": str(e), "offset": info["offset"] if info else None}), 409
+    return jsonify({"upload_id": upload_id, "offset": new_offset})
+
+@app.route("/uploads/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    """
+    Finish an upload (optional sha256 of the whole file). Afterwards any tool
+    accepts upload_id=<id> in place of a multipart file.
+    """
+    params = request.get_json(silent=True) or request.values
+    try:
+        info = chunked_uploads.complete(upload_id, params.get("sha256"))
+    except KeyError:
+        return jsonify({"status": "notfound"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(info)
 
 # -------------------------
 # STATUS
@@ -1081,12 +3851,13 @@ def status():
     return jsonify({
         "pdf2docx": HAVE_PDF2DOCX,
         "pdfminer": HAVE_PDFMINER,
-        "pandas": HAVE_PANDAS,
         "fpdf": HAVE_FPDF,
+        "pandas": False,   # no longer used; key kept for existing /status clients
         "openpyxl": HAVE_OPENPYXL,
         "docx2pdf": HAVE_DOCX2PDF,
         "ffmpeg_path": os.path.exists(FFMPEG_PATH),
-        "pillow": HAVE_PIL
+        "pillow": HAVE_PIL,
+        "result_cache": result_cache.stats()
     })
 
 # -------------------------
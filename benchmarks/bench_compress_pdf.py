@@ -0,0 +1,49 @@
+"""
+Compare the single-process and page-range Ghostscript engines on a PDF.
+
+    python benchmarks/bench_compress_pdf.py scan.pdf
+    python benchmarks/bench_compress_pdf.py scan.pdf --workers 2 4 --pages-per-range 25 --render-threads 2
+
+Needs Ghostscript on PATH; the page-range engine also needs pypdf.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def run(func, out_path, **kwargs):
+    start = time.perf_counter()
+    func(output_path=out_path, **kwargs)
+    return time.perf_counter() - start, os.path.getsize(out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="input PDF")
+    parser.add_argument("--quality", default="ebook", choices=app.PDF_GS_QUALITIES)
+    parser.add_argument("--workers", type=int, nargs="+", default=[app.PDF_GS_WORKERS], help="gs processes at once")
+    parser.add_argument("--pages-per-range", type=int, default=app.PDF_GS_PAGES_PER_RANGE)
+    parser.add_argument("--render-threads", type=int, default=None, help="-dNumRenderingThreads per gs process")
+    args = parser.parse_args()
+
+    common = {"input_path": args.pdf, "quality": args.quality, "render_threads": args.render_threads}
+    print(f"input: {os.path.getsize(args.pdf)} bytes")
+    print(f"{'engine':>16} {'seconds':>10} {'pdf bytes':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        secs, size = run(app.compress_pdf_with_ghostscript, os.path.join(tmp, "single.pdf"), **common)
+        print(f"{'single':>16} {secs:>10.2f} {size:>12}")
+
+        for workers in args.workers:
+            secs, size = run(app.compress_pdf_page_ranges, os.path.join(tmp, f"ranges_{workers}.pdf"),
+                             workers=workers, pages_per_range=args.pages_per_range, **common)
+            print(f"{f'ranges x{workers}':>16} {secs:>10.2f} {size:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the txt_to_pdf engines on synthetic log files.
+
+    python benchmarks/bench_txt_to_pdf.py              # 1, 10 and 100 MB, every engine
+    python benchmarks/bench_txt_to_pdf.py --sizes 1 10 --fpdf-max-mb 10
+
+Engines:
+    original   the txt_to_pdf loop as it was before the reportlab engine
+               (one multi_cell per line). It relies on PyFPDF resetting x
+               after multi_cell; under fpdf2 it fails and is reported as such.
+    fpdf       app.render_text_pdf_fpdf, the same loop made to work on fpdf2
+               (the fallback when reportlab is missing)
+    reportlab  app.render_text_pdf
+
+The FPDF paths are slow on large inputs (the 100 MB run can take a long
+time); --fpdf-max-mb skips them above a size.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def make_log(path, size_mb, seed=1):
+    rnd = random.Random(seed)
+    words = ["GET", "POST", "/api/v1/items", "200", "404", "timeout", "user", "session",
+             "cache", "miss", "hit", "worker", "INFO", "WARN", "ERROR", "retrying"]
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        n = 0
+        while written < target:
+            n += 1
+            line = f"2024-01-01 12:00:{n % 60:02d} " + " ".join(rnd.choice(words) for _ in range(rnd.randint(4, 40))) + "\n"
+            f.write(line)
+            written += len(line)
+
+
+def render_text_pdf_original(in_path, out_path):
+    """The body of the txt_to_pdf route before the reportlab engine, unchanged."""
+    pdf = app.FPDF()
+    pdf.add_page()
+
+    font_path = os.path.join(app.BASE_DIR, "NotoSans-Regular.ttf")
+    if os.path.exists(font_path):
+        pdf.add_font("Noto", "", font_path, uni=True)
+        pdf.set_font("Noto", size=11)
+    else:
+        pdf.set_font("Helvetica", size=11)
+
+    with open(in_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            pdf.multi_cell(0, 8, line.rstrip())
+
+    pdf.output(out_path)
+    return out_path
+
+
+def run(func, in_path, out_path):
+    start = time.perf_counter()
+    func(in_path, out_path)
+    return time.perf_counter() - start, os.path.getsize(out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100], help="input sizes in MB")
+    parser.add_argument("--fpdf-max-mb", type=int, default=None, help="skip the FPDF paths above this size")
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'engine':>10} {'seconds':>10} {'pdf bytes':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            src = os.path.join(tmp, f"log_{size}mb.txt")
+            make_log(src, size)
+
+            engines = []
+            if app.HAVE_FPDF and (args.fpdf_max_mb is None or size <= args.fpdf_max_mb):
+                engines.append(("original", render_text_pdf_original))
+                engines.append(("fpdf", app.render_text_pdf_fpdf))
+            if app.HAVE_REPORTLAB:
+                engines.append(("reportlab", app.render_text_pdf))
+
+            for name, func in engines:
+                try:
+                    secs, out_size = run(func, src, os.path.join(tmp, f"{name}_{size}.pdf"))
+                except Exception as e:
+                    print(f"{size:>4}MB {name:>10}     failed: {e}")
+                    continue
+                print(f"{size:>4}MB {name:>10} {secs:>10.2f} {out_size:>12}")
+
+
+if __name__ == "__main__":
+    main()
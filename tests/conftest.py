@@ -0,0 +1,33 @@
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    return app_module
+
+
+@pytest.fixture
+def client():
+    app_module.app.config["TESTING"] = True
+    return app_module.app.test_client()
+
+
+def image_bytes(size=(64, 48), color=(200, 30, 30), fmt="PNG", noise=False, mode="RGB"):
+    """Encoded test image; noise=True gives a photo-like image that compresses poorly."""
+    from PIL import Image
+
+    if noise:
+        img = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    else:
+        img = Image.new(mode, size, color)
+    buf = BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
@@ -0,0 +1,62 @@
+import os
+import time
+
+
+def write(path, size, age=0):
+    path.write_bytes(b"x" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+def test_make_key_depends_on_content_tool_and_params(app, tmp_path):
+    a = write(tmp_path / "a.pdf", 10)
+    b = write(tmp_path / "b.pdf", 10)
+    key = app.ResultCache.make_key(a, "compress_pdf", {"level": "ebook"})
+    assert key == app.ResultCache.make_key(b, "compress_pdf", {"level": "ebook", "unused": None})
+    assert key != app.ResultCache.make_key(a, "compress_pdf", {"level": "screen"})
+    assert key != app.ResultCache.make_key(a, "pdf_to_word", {"level": "ebook"})
+
+
+def test_lru_eviction_by_size(app, tmp_path):
+    cache = app.ResultCache(max_bytes=250, max_age=3600)
+    paths = [write(tmp_path / f"out{i}", 100) for i in range(3)]
+    cache.put("k0", paths[0])
+    cache.put("k1", paths[1])
+    assert cache.get("k0") == os.path.abspath(paths[0])   # k1 is now least recently used
+    cache.put("k2", paths[2])
+
+    assert cache.get("k1") is None
+    assert not os.path.exists(paths[1])
+    assert cache.get("k0") and cache.get("k2")
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 200
+
+
+def test_expired_entries_are_deleted(app, tmp_path):
+    cache = app.ResultCache(max_bytes=10_000, max_age=60)
+    path = write(tmp_path / "out", 10)
+    cache.put("k", path)
+    cache._entries["k"]["created"] -= 120
+    assert cache.get("k") is None
+    assert not os.path.exists(path)
+
+
+def test_folder_files_unknown_to_the_index_are_adopted(app, tmp_path):
+    stale = write(tmp_path / "before_restart.pdf", 10, age=7200)
+    old = write(tmp_path / "uncached.pdf", 100, age=600)
+    fresh = write(tmp_path / "being_written.mp4", 100)
+
+    cache = app.ResultCache(max_bytes=150, max_age=3600, folder=str(tmp_path), sweep_grace=300)
+    # Past max_age: removed at startup
+    assert not os.path.exists(stale)
+    assert os.path.exists(old)
+    assert cache.stats()["bytes"] == 100
+
+    # A new cached output pushes the folder over max_bytes: the adopted file goes first
+    cache.put("k", write(tmp_path / "cached.pdf", 100))
+    assert not os.path.exists(old)
+    assert cache.get("k")
+    # Recently modified files are not touched
+    assert os.path.exists(fresh)
@@ -0,0 +1,138 @@
+import json
+from io import BytesIO
+
+import pytest
+
+from conftest import image_bytes
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def photo(size=(320, 240)):
+    return Image.open(BytesIO(image_bytes(size, noise=True))).convert("RGB")
+
+
+def test_quality_search_returns_highest_quality_that_fits(app):
+    img = photo()
+    budget = len(app.encode_image(img, "jpeg", 60)) + 1
+    quality, data = app.compress_image_to_size(img, budget, max_quality=95)
+    assert len(data) <= budget
+    assert len(app.encode_image(img, "jpeg", quality + 1)) > budget
+
+
+def test_probe_path_for_large_images_still_fits(app):
+    img = photo((1400, 1000))
+    assert img.size[0] * img.size[1] > app.IMAGE_PROBE_MIN_PIXELS
+    budget = len(app.encode_image(img, "jpeg", 50))
+    quality, data = app.compress_image_to_size(img, budget)
+    assert len(data) <= budget
+    assert quality >= 45
+
+
+def test_low_max_quality_is_honoured(app):
+    quality, _ = app.compress_image_to_size(photo(), 10 ** 9, max_quality=5)
+    assert quality == 5
+    quality, _ = app.compress_image_to_size(photo(), 1, max_quality=5)
+    assert quality == 5
+
+
+def test_unreachable_target_is_reported(app):
+    fmt, data, summary = app.compress_image_data(image_bytes((320, 240), noise=True, fmt="PNG"), target_kb=1)
+    assert fmt == "jpeg"
+    assert summary["target_met"] is False
+    assert summary["output_bytes"] == len(data) > summary["budget_bytes"] == 1024
+    assert summary["quality"] == 10
+
+
+def test_reachable_target_is_met(app):
+    original = image_bytes((320, 240), noise=True, fmt="PNG")
+    fmt, data, summary = app.compress_image_data(original, quality=90, target_ratio=50, fmt="webp")
+    assert fmt == "webp" and summary["target_met"]
+    assert len(data) <= len(original) / 2
+
+
+def test_auto_keeps_transparency(app):
+    rgba = image_bytes((64, 64), color=(255, 0, 0, 128), mode="RGBA", fmt="PNG")
+    fmt, data, _ = app.compress_image_data(rgba, fmt="auto", target_kb=100)
+    assert fmt != "jpeg"
+    assert app.has_alpha(Image.open(BytesIO(data)))
+
+
+def test_route_reports_missed_target(client):
+    data = {"file": (BytesIO(image_bytes((320, 240), noise=True, fmt="PNG")), "photo.png"), "target_kb": "1"}
+    r = client.post("/image_compression", data=data, content_type="multipart/form-data")
+    assert r.status_code == 200
+    report = json.loads(r.headers["X-Compression-Report"])
+    assert report["target_met"] is False
+
+
+def test_downscale_image(app):
+    img = Image.open(BytesIO(image_bytes((1600, 1200), noise=True, fmt="JPEG")))
+    out = app.downscale_image(img, 400)
+    assert out.size == (400, 300)
+
+
+def test_batch_lists_missed_targets(client):
+    import zipfile
+
+    files = [(BytesIO(image_bytes((320, 240), noise=True, fmt="PNG")), f"p{i}.png") for i in range(2)]
+    r = client.post("/image_compression", data={"file": files, "target_kb": "1"},
+                    content_type="multipart/form-data")
+    with zipfile.ZipFile(BytesIO(r.data)) as z:
+        assert sorted(z.namelist()) == ["errors.txt", "p0_converted.jpg", "p1_converted.jpg"]
+        assert z.read("errors.txt").decode().count("size target not met") == 2
+
+
+@pytest.mark.parametrize("have_avif", [True, False])
+def test_avif_is_offered_only_when_available(app, client, monkeypatch, have_avif):
+    formats = dict(app.IMAGE_OUTPUT_FORMATS)
+    if have_avif:
+        formats["avif"] = ".avif"
+    else:
+        formats.pop("avif", None)
+    monkeypatch.setattr(app, "IMAGE_OUTPUT_FORMATS", formats)
+    assert (b'value="avif"' in client.get("/image_compression").data) == have_avif
+
+
+def test_auto_skips_lossy_palette_png(app, monkeypatch):
+    monkeypatch.setattr(app, "IMAGE_OUTPUT_FORMATS", {"jpeg": ".jpg", "png": ".png"})
+    many_colours = Image.open(BytesIO(image_bytes((128, 128), noise=True)))
+    assert many_colours.getcolors(256) is None
+    assert app.compress_image_auto(many_colours, 10 ** 9)[0] == "jpeg"
+
+    monkeypatch.setattr(app, "IMAGE_OUTPUT_FORMATS", {"png": ".png"})
+    flat = Image.open(BytesIO(image_bytes((128, 128), color=(10, 200, 10))))
+    assert app.compress_image_auto(flat, 10 ** 9)[:2] == ("png", None)
+
+
+def test_jpeg_draft_keeps_the_reducing_gap(app):
+    img = Image.open(BytesIO(image_bytes((1600, 1200), noise=True, fmt="JPEG")))
+    requested = []
+    draft = img.draft
+    img.draft = lambda mode, size: requested.append(size) or draft(mode, size)
+
+    out = app.downscale_image(img, 200)
+    assert out.size == (200, 150)
+    assert requested == [(200 * app.IMAGE_REDUCING_GAP, 150 * app.IMAGE_REDUCING_GAP)]
+    # Decoded at 1/4 scale (400x300), never down to the target size itself
+    assert img.size == (400, 300)
+
+
+@pytest.mark.parametrize("budget_quality", [15, 60])
+def test_auto_output_matches_a_serial_encode(app, budget_quality):
+    # The formats are searched in threads; each must encode with its own settings
+    img = photo((240, 180))
+    budget = len(app.encode_image(img, "jpeg", budget_quality))
+    for _ in range(4):
+        fmt, quality, data = app.compress_image_auto(img, budget)
+        assert data == app.encode_image(app.prepare_image(img, fmt), fmt, quality)
+
+
+def test_batch_without_a_target_reports_nothing(client):
+    import zipfile
+
+    # Tiny flat PNGs: even the lowest-quality JPEG is larger than the original
+    files = [(BytesIO(image_bytes((8, 8), fmt="PNG")), f"p{i}.png") for i in range(2)]
+    r = client.post("/image_compression", data={"file": files}, content_type="multipart/form-data")
+    with zipfile.ZipFile(BytesIO(r.data)) as z:
+        assert sorted(z.namelist()) == ["p0_converted.jpg", "p1_converted.jpg"]
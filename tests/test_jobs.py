@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+
+import pytest
+
+
+def test_job_backend_is_abstract(app):
+    with pytest.raises(TypeError):
+        app.JobBackend()
+
+
+def test_in_process_backend_runs_by_priority_then_fifo(app):
+    backend = app.InProcessBackend(1)
+    gate = threading.Event()
+    order = []
+    finished = threading.Event()
+
+    backend.submit("blocker", gate.wait)
+    # Wait for the worker to pick up the blocker so the rest stay queued
+    for _ in range(200):
+        if backend.position("blocker") == 0:
+            break
+        threading.Event().wait(0.01)
+    assert backend.position("blocker") == 0
+
+    backend.submit("encode-1", order.append, ("encode-1",))
+    backend.submit("encode-2", order.append, ("encode-2",))
+    backend.submit("copy", order.append, ("copy",), priority=-1)
+    backend.submit("last", finished.set)
+
+    assert backend.position("copy") == 1
+    assert backend.position("encode-1") == 2
+    assert backend.position("encode-2") == 3
+    assert backend.position("unknown") is None
+
+    gate.set()
+    assert finished.wait(5)
+    assert order == ["copy", "encode-1", "encode-2"]
+
+
+def test_in_process_backend_bounds_concurrency(app):
+    backend = app.InProcessBackend(2)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+    done = threading.Semaphore(0)
+
+    def job():
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        threading.Event().wait(0.05)
+        with lock:
+            state["running"] -= 1
+        done.release()
+
+    for i in range(6):
+        backend.submit(f"job{i}", job)
+    for _ in range(6):
+        assert done.acquire(timeout=5)
+    assert state["peak"] == 2
+
+
+def wait_finished(app, job_id, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        data = app.progress_store.get(job_id)
+        if data and data.get("status") in app.FINISHED_STATES:
+            return data
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {app.progress_store.get(job_id)}")
+
+
+def test_job_that_raises_is_recorded_as_an_error(app, caplog):
+    backend = app.InProcessBackend(1)
+    app.progress_store.update("doomed", {"status": "queued", "percent": 0})
+
+    def boom():
+        raise RuntimeError("disk on fire")
+
+    backend.submit("doomed", boom)
+    assert wait_finished(app, "doomed") == {"status": "error", "error": "disk on fire"}
+    assert "Job doomed failed" in caplog.text
+
+
+def test_converter_job_output_missing_is_an_error(app):
+    # The converter "succeeds" without writing its output
+    job_id = app.start_job(lambda report: None, (), "/nonexistent/out.pdf", "out.pdf")
+    data = wait_finished(app, job_id)
+    assert data["status"] == "error"
+
+
+@pytest.fixture
+def finished_job(app, tmp_path):
+    def convert(text, report):
+        report.stage("writing")
+        with open(output, "w") as f:
+            f.write(text)
+        report.summary({"pages": 1})
+
+    output = os.path.join(app.DOWNLOAD_FOLDER, f"test_job_{os.getpid()}.txt")
+    job_id = app.start_job(convert, ("converted text",), output, "result.txt")
+    wait_finished(app, job_id)
+    yield job_id
+    if os.path.exists(output):
+        os.remove(output)
+
+
+def test_job_status_endpoint(app, client, finished_job):
+    r = client.get(f"/jobs/{finished_job}")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data["status"] == "done"
+    assert data["download_url"] == f"/jobs/{finished_job}/download"
+    assert data["report"] == {"pages": 1}
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_job_events_endpoint_streams_until_finished(app, client, finished_job):
+    r = client.get(f"/jobs/{finished_job}/events")
+    assert r.mimetype == "text/event-stream"
+    events = [json.loads(line[len("data: "):]) for line in r.get_data(as_text=True).splitlines()
+              if line.startswith("data: ")]
+    assert events[-1]["status"] == "done"
+    assert "event: notfound" in client.get("/jobs/unknown/events").get_data(as_text=True)
+
+
+def test_job_download_endpoint(app, client, finished_job):
+    r = client.get(f"/jobs/{finished_job}/download")
+    assert r.status_code == 200
+    assert r.data == b"converted text"
+    assert 'filename=result.txt' in r.headers["Content-Disposition"]
+    assert client.get("/jobs/unknown/download").status_code == 404
+
+
+def test_job_download_refuses_unfinished_and_outside_paths(app, client):
+    app.progress_store.update("busy", {"status": "running", "percent": 10})
+    r = client.get("/jobs/busy/download")
+    assert r.status_code == 409
+    assert r.get_json()["status"] == "running"
+
+    app.progress_store.update("escaped", {"status": "done", "output": os.path.abspath(__file__)})
+    assert client.get("/jobs/escaped/download").status_code == 404
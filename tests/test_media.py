@@ -0,0 +1,56 @@
+from conftest import image_bytes
+
+
+def test_recompress_media_pool_matches_serial(app):
+    items = {f"word/media/image{i}.png": image_bytes((400, 300), noise=True) for i in range(4)}
+    serial = app.recompress_media(items, 200, 60, workers=1)
+    pooled = app.recompress_media(items, 200, 60, workers=2)
+    assert serial.keys() == items.keys()
+    assert pooled == serial
+
+
+def test_recompress_media_keeps_originals_that_would_grow_or_fail(app):
+    tiny = image_bytes((8, 8), fmt="PNG")
+    items = {"tiny.png": tiny, "broken.png": b"not an image"}
+    stats = app.CompressionStats()
+    assert app.recompress_media(items, 1600, 70, workers=2, stats=stats) == {}
+    assert stats.parts["broken.png"]["recompressed_bytes"] is None
+
+
+def _radial(size=(120, 90), tint=(0, 0, 0), fmt="PNG", quality=None):
+    from io import BytesIO
+    from PIL import Image
+
+    img = Image.new("RGB", size)
+    cx, cy = size[0] // 2, size[1] // 2
+    img.putdata([(min(255, abs(x - cx) * 2 + tint[0]), min(255, abs(y - cy) * 2 + tint[1]), tint[2])
+                 for y in range(size[1]) for x in range(size[0])])
+    buf = BytesIO()
+    img.save(buf, format=fmt, **({"quality": quality} if quality else {}))
+    return buf.getvalue()
+
+
+def test_perceptual_dedupe_merges_recompressed_copies(app):
+    deduper = app.MediaDeduper(recompress=dict, perceptual=True)
+    batch = {"a.png": _radial(), "b.jpg": _radial(fmt="JPEG", quality=60)}
+    assert deduper.find_duplicates(batch) == {"b.jpg": "a.png"}
+
+
+def test_perceptual_dedupe_keeps_flat_colours_apart(app):
+    deduper = app.MediaDeduper(recompress=dict, perceptual=True)
+    batch = {
+        "red.png": image_bytes((80, 60), color=(220, 20, 20)),
+        "blue.png": image_bytes((80, 60), color=(20, 20, 220)),
+        "white.png": image_bytes((40, 30), color=(255, 255, 255)),
+    }
+    assert deduper.find_duplicates(batch) == {}
+
+
+def test_perceptual_dedupe_compares_shape_and_colour(app):
+    deduper = app.MediaDeduper(recompress=dict, perceptual=True)
+    batch = {
+        "base.png": _radial(),
+        "wide.png": _radial(size=(240, 90)),
+        "tinted.png": _radial(tint=(0, 0, 120)),
+    }
+    assert deduper.find_duplicates(batch) == {}
@@ -0,0 +1,168 @@
+import json
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from conftest import image_bytes
+
+
+class WriteOnly:
+    """Sink without tell(), like a response body: zipfile adds data descriptors."""
+    def __init__(self):
+        self.buf = BytesIO()
+
+    def write(self, data):
+        return self.buf.write(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return self.buf.getvalue()
+
+
+def make_package(path, streamed=False):
+    """
+    A small OOXML-like package with deflated and stored members. streamed=True
+    writes it to a write-only stream, so members carry data descriptors.
+    """
+    members = {
+        "[Content_Types].xml": b'<?xml version="1.0"?><Types/>' * 20,
+        "docProps/core.xml": b"<core>author</core>",
+        "word/document.xml": b"<w:document>" + b"<w:p>text</w:p>" * 500 + b"</w:document>",
+        "word/media/image1.png": image_bytes((300, 200), noise=True),
+    }
+    buf = WriteOnly() if streamed else BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            with z.open(name, "w") as f:
+                f.write(data)
+        z.writestr(zipfile.ZipInfo("word/stored.bin"), b"\x00" * 100)
+    members["word/stored.bin"] = b"\x00" * 100
+    path.write_bytes(buf.getvalue())
+    return members
+
+
+@pytest.mark.parametrize("raw_writes", [True, False])
+@pytest.mark.parametrize("streamed", [False, True])
+def test_rewrite_ooxml_round_trip(app, tmp_path, monkeypatch, raw_writes, streamed):
+    monkeypatch.setattr(app, "ZIP_RAW_WRITES", raw_writes and app.ZIP_RAW_WRITES)
+    src, out = tmp_path / "in.docx", tmp_path / "out.docx"
+    members = make_package(src, streamed)
+    with zipfile.ZipFile(src) as z:
+        assert bool(z.getinfo("word/media/image1.png").flag_bits & 0x08) == streamed
+
+    app.rewrite_ooxml(str(src), str(out), [
+        ("word/document.xml", lambda batch: {name: data.replace(b"text", b"TEXT") for name, data in batch.items()}),
+        ("docProps/", app._drop_members),
+    ])
+
+    with zipfile.ZipFile(out) as z:
+        assert z.testzip() is None
+        names = z.namelist()
+        assert "docProps/core.xml" not in names
+        assert z.read("word/document.xml") == members["word/document.xml"].replace(b"text", b"TEXT")
+        for name in ("[Content_Types].xml", "word/media/image1.png", "word/stored.bin"):
+            assert z.read(name) == members[name]
+        assert z.getinfo("word/stored.bin").compress_type == zipfile.ZIP_STORED
+    with zipfile.ZipFile(src) as z:
+        # Untouched members keep their original order
+        assert [n for n in z.namelist() if n in names] == names
+
+
+def test_compress_xlsx_output_opens_in_openpyxl(app, tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, 200):
+        ws.append([row, f"name {row}", f"=A{row}*2"])
+    src, out = tmp_path / "in.xlsx", tmp_path / "out.xlsx"
+    wb.save(src)
+
+    app.compress_xlsx_file(str(src), str(out), flatten_formulas=False)
+    with zipfile.ZipFile(out) as z:
+        assert z.testzip() is None
+    ws = openpyxl.load_workbook(out).active
+    assert ws["B150"].value == "name 150"
+    assert ws["C3"].value == "=A3*2"
+
+
+def test_compress_docx_output_opens_in_python_docx(app, tmp_path):
+    docx = pytest.importorskip("docx")
+    doc = docx.Document()
+    doc.add_paragraph("hello world")
+    src, out = tmp_path / "in.docx", tmp_path / "out.docx"
+    doc.save(src)
+
+    app.compress_docx_file(str(src), str(out))
+    assert docx.Document(str(out)).paragraphs[0].text == "hello world"
+
+
+def test_compress_pptx_output_opens_in_python_pptx(app, tmp_path):
+    pptx = pytest.importorskip("pptx")
+    prs = pptx.Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    slide.shapes.title.text = "title"
+    src, out = tmp_path / "in.pptx", tmp_path / "out.pptx"
+    prs.save(src)
+
+    app.compress_pptx_file(str(src), str(out))
+    assert pptx.Presentation(str(out)).slides[0].shapes.title.text == "title"
+
+
+def make_docx_with_media(path):
+    photo = image_bytes((1800, 1200), noise=True)
+    members = {
+        "[Content_Types].xml": b'<?xml version="1.0"?><Types>'
+                               b'<Override PartName="/word/media/image2.png" ContentType="image/png"/>'
+                               b'<Override PartName="/word/document.xml" ContentType="application/xml"/></Types>',
+        "word/_rels/document.xml.rels": b'<Relationships>'
+                                        b'<Relationship Id="r1" Target="media/image1.png"/>'
+                                        b'<Relationship Id="r2" Target="media/image2.png"/>'
+                                        b'<Relationship Id="r3" Target="media/tiny.png"/></Relationships>',
+        "word/document.xml": b"<w:document/>",
+        "word/media/image1.png": photo,
+        "word/media/image2.png": photo,
+        "word/media/tiny.png": image_bytes((8, 8)),
+        "docProps/core.xml": b"<core>author</core>",
+    }
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return str(path)
+
+
+def test_docx_report_lists_each_part_decision_and_totals(app, tmp_path):
+    src, out = make_docx_with_media(tmp_path / "in.docx"), str(tmp_path / "out.docx")
+    report = app.SummaryReporter()
+    app.compress_docx_file(src, out, report=report)
+    summary = report.summary_data
+    parts = {p["name"]: p for p in summary["parts"]}
+
+    assert {name: p["action"] for name, p in parts.items()} == {
+        "[Content_Types].xml": "rewritten",         # Override for the dropped duplicate removed
+        "word/_rels/document.xml.rels": "rewritten",
+        "word/media/image1.png": "rewritten",       # recompressed
+        "word/media/image2.png": "dropped",         # duplicate of image1
+        "word/media/tiny.png": "kept",              # recompressing would make it bigger
+        "docProps/core.xml": "dropped",
+    }
+    assert parts["word/media/image2.png"]["duplicate_of"] == "word/media/image1.png"
+    assert parts["word/media/tiny.png"]["recompressed_bytes"] > parts["word/media/tiny.png"]["original_bytes"]
+    with zipfile.ZipFile(out) as z:
+        for name, part in parts.items():
+            if part["action"] == "dropped":
+                assert part["output_bytes"] == 0 and name not in z.namelist()
+            else:
+                assert part["output_bytes"] == z.getinfo(name).file_size
+
+    assert summary["input_bytes"] == (tmp_path / "in.docx").stat().st_size
+    assert summary["output_bytes"] == (tmp_path / "out.docx").stat().st_size
+    assert summary["saved_bytes"] == summary["input_bytes"] - summary["output_bytes"] > 0
+    assert summary["saved_percent"] == round(summary["saved_bytes"] * 100.0 / summary["input_bytes"], 2)
+
+    response = app.with_summary_header(app.app.response_class(b""), summary)
+    header = json.loads(response.headers["X-Compression-Report"])
+    assert "parts" not in header
+    assert header["saved_bytes"] == summary["saved_bytes"]
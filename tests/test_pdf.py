@@ -0,0 +1,176 @@
+import pytest
+
+
+def make_pdf(path, pages=3, lines=5, bookmarks=False, link=False):
+    """A reportlab PDF with text on every page, optionally with an outline and a link."""
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    c = canvas.Canvas(str(path))
+    for page in range(pages):
+        for line in range(lines):
+            c.drawString(72, 720 - 14 * line, f"page {page + 1} line {line + 1}")
+        if bookmarks:
+            c.bookmarkPage(f"p{page}")
+            c.addOutlineEntry(f"Page {page + 1}", f"p{page}", level=0)
+        if link and page == 0:
+            c.linkURL("https://example.com", (72, 600, 200, 620))
+        c.showPage()
+    c.save()
+    return str(path)
+
+
+def test_iter_pdf_text_matches_extract_text(app, tmp_path):
+    high_level = pytest.importorskip("pdfminer.high_level")
+    pdf = make_pdf(tmp_path / "in.pdf", pages=3)
+    pages = list(app.iter_pdf_text(pdf))
+    assert len(pages) == 3
+    assert "page 2 line 4" in pages[1]
+    assert "".join(pages) == high_level.extract_text(pdf)
+    assert app.pdf_page_count(pdf) == 3
+
+
+def test_parallel_text_matches_serial(app, tmp_path, monkeypatch):
+    pytest.importorskip("pdfminer")
+    monkeypatch.setattr(app, "PDF_TEXT_PAGES_PER_TASK", 2)
+    pdf = make_pdf(tmp_path / "in.pdf", pages=5)
+    assert "".join(app.iter_pdf_text_parallel(pdf, workers=2)) == "".join(app.iter_pdf_text(pdf))
+
+
+def strip_dimensions(src, dst):
+    import re
+    import zipfile
+
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, "w") as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb"<dimension[^>]*/>", b"", data)
+            zout.writestr(info, data)
+    return str(dst)
+
+
+@pytest.mark.parametrize("with_dimensions", [True, False])
+def test_excel_pdf_keeps_columns_that_start_after_the_sample(app, tmp_path, with_dimensions):
+    openpyxl = pytest.importorskip("openpyxl")
+    pypdf = pytest.importorskip("pypdf")
+    pytest.importorskip("reportlab")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, app.EXCEL_PDF_SAMPLE_ROWS + 51):
+        ws.append([row, "x"] + ([None, None, f"late{row}"] if row > app.EXCEL_PDF_SAMPLE_ROWS else []))
+    src = tmp_path / "in.xlsx"
+    wb.save(src)
+    if not with_dimensions:
+        src = strip_dimensions(src, tmp_path / "nodim.xlsx")
+
+    out = tmp_path / "out.pdf"
+    app.render_workbook_pdf(str(src), str(out))
+    text = "".join(page.extract_text() for page in pypdf.PdfReader(out).pages)
+    assert f"late{app.EXCEL_PDF_SAMPLE_ROWS + 50}" in text
+
+
+@pytest.mark.parametrize("engine", ["render_text_pdf", "render_text_pdf_fpdf"])
+def test_text_pdf_engines_keep_every_line(app, tmp_path, engine):
+    pypdf = pytest.importorskip("pypdf")
+    if not (app.HAVE_REPORTLAB if engine == "render_text_pdf" else app.HAVE_FPDF):
+        pytest.skip("engine not installed")
+    src = tmp_path / "in.txt"
+    src.write_text("".join(f"line {i} " + "word " * (i % 30) + "\n" for i in range(300)), encoding="utf-8")
+    out = tmp_path / "out.pdf"
+
+    getattr(app, engine)(str(src), str(out))
+    text = "".join(page.extract_text() for page in pypdf.PdfReader(out).pages)
+    assert "line 0" in text and "line 299" in text
+
+
+@pytest.mark.parametrize("features, engine", [
+    ({}, "parallel"),
+    ({"bookmarks": True}, "single"),
+    ({"link": True}, "single"),
+])
+def test_auto_pdf_engine_keeps_document_structure_on_one_run(app, tmp_path, monkeypatch, features, engine):
+    pytest.importorskip("pypdf")
+    monkeypatch.setattr(app, "PDF_GS_WORKERS", 2)
+    monkeypatch.setattr(app, "PDF_GS_PARALLEL_MIN_PAGES", 4)
+    chosen = []
+    monkeypatch.setattr(app, "compress_pdf_with_ghostscript", lambda *a, **kw: chosen.append(("single", kw)))
+    monkeypatch.setattr(app, "compress_pdf_page_ranges", lambda *a, **kw: chosen.append(("parallel", kw)))
+
+    pdf = make_pdf(tmp_path / "in.pdf", pages=4, **features)
+    app.compress_pdf_file(pdf, str(tmp_path / "out.pdf"))
+    assert [name for name, _ in chosen] == [engine]
+    if engine == "parallel":
+        # The reader opened to decide is reused, not parsed a second time
+        assert len(chosen[0][1]["reader"].pages) == 4
+
+
+def test_auto_pdf_engine_stays_single_for_short_documents(app, tmp_path, monkeypatch):
+    pytest.importorskip("pypdf")
+    monkeypatch.setattr(app, "PDF_GS_WORKERS", 2)
+    chosen = []
+    monkeypatch.setattr(app, "compress_pdf_with_ghostscript", lambda *a, **kw: chosen.append("single"))
+    monkeypatch.setattr(app, "compress_pdf_page_ranges", lambda *a, **kw: chosen.append("parallel"))
+    app.compress_pdf_file(make_pdf(tmp_path / "in.pdf", pages=3), str(tmp_path / "out.pdf"))
+    assert chosen == ["single"]
+
+
+def make_table_pdf(path, pages=3, rows=4):
+    """One ruled table per page, each starting with the same header row."""
+    pytest.importorskip("reportlab")
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import PageBreak, SimpleDocTemplate, Table, TableStyle
+
+    story = []
+    for page in range(pages):
+        data = [["name", "qty"]] + [[f"item{page}-{r}", str(r)] for r in range(rows)]
+        story.append(Table(data, style=TableStyle([("GRID", (0, 0), (-1, -1), 0.5, (0, 0, 0))])))
+        story.append(PageBreak())
+    SimpleDocTemplate(str(path), pagesize=A4).build(story)
+    return str(path)
+
+
+def read_table_output(path, fmt):
+    if fmt == "csv":
+        import csv
+
+        with open(path, newline="", encoding="utf-8") as f:
+            return [row for row in csv.reader(f)]
+    openpyxl = pytest.importorskip("openpyxl")
+    ws = openpyxl.load_workbook(path).active
+    assert ws.cell(1, 1).font.b
+    return [[("" if v is None else str(v)) for v in row] for row in ws.iter_rows(values_only=True)]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "xlsx"])
+def test_pdf_tables_keep_one_header(app, tmp_path, fmt):
+    pytest.importorskip("pdfplumber")
+    pdf = make_table_pdf(tmp_path / "tables.pdf", pages=3)
+    out = app.convert_pdf_tables(pdf, str(tmp_path / f"out.{fmt}"), fmt)
+    rows = read_table_output(out, fmt)
+    assert rows[0] == ["name", "qty"]
+    assert rows.count(["name", "qty"]) == 1
+    assert [r[0] for r in rows[1:]] == [f"item{p}-{r}" for p in range(3) for r in range(4)]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "xlsx"])
+def test_pdf_tables_header_comes_from_the_first_page_with_a_table(app, tmp_path, monkeypatch, fmt):
+    if fmt == "xlsx":
+        pytest.importorskip("openpyxl")
+    pages = [(1, [], 4),
+             (2, [["a", "b"], ["1", "2"]], 4),
+             (3, [["a", "b"], ["3", "4"], ["a", "b"]], 4),
+             (4, [["5", "6"]], 4)]
+    monkeypatch.setattr(app, "iter_pdf_table_pages", lambda in_path, pages_arg=None: iter(pages))
+    out = app.convert_pdf_tables("in.pdf", str(tmp_path / f"out.{fmt}"), fmt)
+    assert read_table_output(out, fmt) == [["a", "b"], ["1", "2"], ["3", "4"], ["5", "6"]]
+
+
+def test_pdf_tables_without_a_table_leave_no_file(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "iter_pdf_table_pages", lambda in_path, pages_arg=None: iter([(1, [], 1)]))
+    out = tmp_path / "out.csv"
+    with pytest.raises(ValueError):
+        app.convert_pdf_tables("in.pdf", str(out), "csv")
+    assert not out.exists()
+
+
+def test_status_keeps_the_pandas_key(client):
+    assert client.get("/status").get_json()["pandas"] is False
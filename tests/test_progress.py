@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_counter_updates_are_throttled(app, clock):
+    store = app.ProgressStore(min_interval=0.5, ttl=60)
+    assert store.update("job", {"status": "running", "percent": 1})
+    clock[0] += 0.1
+    assert not store.update("job", {"status": "running", "percent": 2})
+    assert store.get("job")["percent"] == 1
+    clock[0] += 0.5
+    assert store.update("job", {"status": "running", "percent": 3})
+    assert store.get("job")["percent"] == 3
+
+
+def test_status_changes_and_forced_updates_always_go_through(app, clock):
+    store = app.ProgressStore(min_interval=0.5, ttl=60)
+    store.update("job", {"status": "queued"})
+    assert store.update("job", {"status": "running", "percent": 0})
+    assert store.update("job", {"status": "running", "percent": 5}, force=True)
+    assert store.update("job", {"status": "done", "percent": 100})
+    assert store.get("job") == {"status": "done", "percent": 100}
+
+
+def test_finished_jobs_expire_after_ttl(app, clock):
+    store = app.ProgressStore(min_interval=0.5, ttl=60)
+    store.update("old", {"status": "done"})
+    store.update("active", {"status": "running"})
+    clock[0] += 61
+    store.update("other", {"status": "queued"})   # expiry runs on update
+    assert store.get("old") is None
+    assert store.get("active") == {"status": "running"}
+
+
+def test_wait_wakes_on_update_and_times_out(app):
+    store = app.ProgressStore(min_interval=0, ttl=60)
+    store.update("job", {"status": "running", "percent": 0})
+    data, version = store.wait("job", -1, timeout=1)
+    assert data["percent"] == 0
+
+    threading.Timer(0.05, store.update, ("job", {"status": "done", "percent": 100})).start()
+    data, new_version = store.wait("job", version, timeout=5)
+    assert new_version == version + 1 and data["status"] == "done"
+
+    # Nothing new: returns the current state once the timeout passes
+    assert store.wait("job", new_version, timeout=0.05) == (data, new_version)
+    assert store.wait("unknown", 0, timeout=0.05) == (None, 0)
+
+
+def test_state_changes_persist_and_recover(app, tmp_path):
+    store = app.ProgressStore(min_interval=60, ttl=60, persist_dir=str(tmp_path))
+    store.update("finished", {"status": "done", "output": "x.pdf"})
+    store.update("interrupted", {"status": "running", "percent": 40})
+    store.update("interrupted", {"status": "running", "percent": 45}, force=True)
+    with open(tmp_path / "interrupted.json") as f:
+        assert json.load(f)["percent"] == 45
+    (tmp_path / "garbage.json").write_text("{not json")
+
+    recovered = app.ProgressStore(min_interval=60, ttl=60, persist_dir=str(tmp_path))
+    assert recovered.get("finished") == {"status": "done", "output": "x.pdf"}
+    assert recovered.get("interrupted") == {"status": "error", "error": "interrupted by server restart"}
+    assert recovered.get("garbage") is None
+
+
+def test_expired_jobs_are_removed_from_disk(app, clock, tmp_path):
+    store = app.ProgressStore(min_interval=0.5, ttl=60, persist_dir=str(tmp_path))
+    store.update("old", {"status": "failed", "error": "x"})
+    assert (tmp_path / "old.json").exists()
+    clock[0] += 61
+    store.update("new", {"status": "queued"})
+    assert not (tmp_path / "old.json").exists()
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import zipfile
+from io import BytesIO
+
+import pytest
+
+
+@pytest.fixture
+def registry(app, tmp_path):
+    return app.ChunkedUploadRegistry(str(tmp_path), ttl=3600)
+
+
+def test_chunks_must_arrive_in_order_and_match_checksums(registry):
+    upload_id = registry.create("report.pdf", size=6)
+    assert registry.write_chunk(upload_id, 0, BytesIO(b"abc"), 3) == 3
+    with pytest.raises(ValueError):
+        registry.write_chunk(upload_id, 0, BytesIO(b"abc"), 3)   # wrong offset
+    with pytest.raises(ValueError):
+        registry.write_chunk(upload_id, 3, BytesIO(b"def"), 3, checksum="00" * 32)
+    assert registry.info(upload_id)["offset"] == 3
+
+    registry.write_chunk(upload_id, 3, BytesIO(b"def"), 3, checksum=hashlib.sha256(b"def").hexdigest())
+    with pytest.raises(ValueError):
+        registry.complete(upload_id, checksum="00" * 32)
+    assert registry.complete(upload_id, hashlib.sha256(b"abcdef").hexdigest())["complete"]
+
+    upload = registry.claim(upload_id)
+    with upload.open() as f:
+        assert f.read() == b"abcdef"
+    assert registry.claim(upload_id) is None
+
+
+def test_unfinished_uploads_cannot_be_claimed(registry):
+    upload_id = registry.create("report.pdf", size=6)
+    registry.write_chunk(upload_id, 0, BytesIO(b"abc"), 3)
+    with pytest.raises(ValueError):
+        registry.complete(upload_id)
+    assert registry.claim(upload_id) is None
+
+
+def test_idle_uploads_expire(app, tmp_path):
+    registry = app.ChunkedUploadRegistry(str(tmp_path), ttl=-1)
+    upload_id = registry.create("report.pdf")
+    path = registry._uploads[upload_id]["path"]
+    registry.create("other.pdf")
+    assert registry.info(upload_id) is None
+    assert not os.path.exists(path)
+
+
+def upload(client, name, data):
+    upload_id = client.post("/uploads", json={"filename": name, "size": len(data)}).get_json()["upload_id"]
+    assert client.put(f"/uploads/{upload_id}?offset=0", data=data).status_code == 200
+    assert client.post(f"/uploads/{upload_id}/complete").status_code == 200
+    return upload_id
+
+
+def test_rejected_chunked_upload_is_discarded(app, client):
+    upload_id = upload(client, "notes.txt", b"not a pdf")
+    path = app.chunked_uploads._uploads[upload_id]["path"]
+
+    # Rejected with "Please upload a PDF" before the file is used
+    assert client.post("/pdf_to_word", data={"upload_id": upload_id}).status_code == 200
+    assert not os.path.exists(path)
+    assert app.chunked_uploads.info(upload_id) is None
+
+
+def test_claimed_upload_used_by_create_zip(app, client):
+    upload_id = upload(client, "notes.txt", b"hello" * 100)
+    path = app.chunked_uploads._uploads[upload_id]["path"]
+
+    r = client.post("/create_zip", data={"upload_id": upload_id})
+    with zipfile.ZipFile(BytesIO(r.data)) as z:
+        assert z.read("notes.txt") == b"hello" * 100
+    assert not os.path.exists(path)
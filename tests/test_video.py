@@ -0,0 +1,219 @@
+import os
+import stat
+import threading
+import time
+from collections import deque
+
+import pytest
+
+
+@pytest.fixture
+def fake_segments(app, monkeypatch, tmp_path):
+    """
+    segmented_encode with ffmpeg/ffprobe replaced: 4 segments of 10 s, and
+    every progress_store update recorded. Returns (run, updates); run(fail=i)
+    makes segment i fail at once while the others wait to be cancelled.
+    """
+    updates = []
+    monkeypatch.setattr(app.progress_store, "update", lambda job_id, data, force=False: updates.append(dict(data)))
+    monkeypatch.setattr(app, "probe_media", lambda path: {"format": {"duration": "40" if path.endswith("in.mp4") else "10"}})
+    monkeypatch.setattr(app, "result_cache", app.ResultCache(1 << 30, 3600))
+
+    def split(input_abs, work_dir, segment_seconds, err_tail):
+        paths = [os.path.join(work_dir, f"source_{i:04d}.mkv") for i in range(4)]
+        for path in paths:
+            open(path, "wb").close()
+        return paths
+
+    def passes(source, out, *args, **kwargs):
+        return [["ffmpeg", "-i", source, out]], {}
+
+    monkeypatch.setattr(app, "split_video_segments", split)
+    monkeypatch.setattr(app, "build_video_passes", passes)
+
+    def run(fail=None):
+        concat_lists = []
+
+        def ffmpeg(args, err_tail, on_progress, cancel=None):
+            if "concat" in args:
+                concat_lists.append(open(args[args.index("-i") + 1]).read())
+                with open(args[-1], "wb") as f:
+                    f.write(b"x" * 1000)
+                return 0
+            index = int(args[2][-8:-4])
+            if index == fail:
+                err_tail.append(f"segment {index} broke")
+                return 1
+            if fail is not None:
+                # Stand in for a long encode: only a cancel ends it early
+                assert cancel.wait(5)
+                return -9
+            for seconds in (5, 10):
+                on_progress({"out_time_us": str(seconds * 1_000_000), "frame": str(seconds * 25),
+                             "progress": "continue"})
+            open(args[-1], "wb").close()
+            return 0
+
+        monkeypatch.setattr(app, "_run_ffmpeg", ffmpeg)
+        output = str(tmp_path / "out.mp4")
+        started = time.monotonic()
+        app.segmented_encode(str(tmp_path / "in.mp4"), output, "job", workers=4)
+        return updates[-1], time.monotonic() - started, concat_lists
+
+    return run, updates
+
+
+def test_segmented_encode_merges_progress(app, fake_segments):
+    run, updates = fake_segments
+    done, _, concat_lists = run()
+
+    assert done["status"] == "done"
+    assert [s["index"] for s in done["segments"]] == [1, 2, 3, 4]
+    encoding = [u for u in updates if u.get("stage") == "encoding"]
+    percents = [u["percent"] for u in encoding]
+    assert max(percents) == 100.0 - app.VIDEO_SEGMENT_JOIN_PERCENT
+    assert encoding[-1]["frame"] == 4 * 250
+    assert encoding[-1]["segments_total"] == 4
+    assert [u for u in updates if u.get("stage") == "joining"][0]["segments_done"] == 4
+    assert concat_lists[0].count("file '") == 4
+
+
+def test_segmented_encode_cancels_on_first_failure(app, fake_segments):
+    run, _ = fake_segments
+    done, elapsed, concat_lists = run(fail=1)
+    assert done == {"status": "failed", "error": "segment 1 broke"}
+    assert elapsed < 4
+    assert not concat_lists
+
+
+def test_concat_list_escapes_quotes(app, tmp_path):
+    path = app._concat_list(["/tmp/it's here.mp4", "/tmp/plain.mp4"], str(tmp_path / "list.txt"))
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "file '/tmp/it'\\''s here.mp4'\nfile '/tmp/plain.mp4'\n"
+
+
+def test_run_ffmpeg_kills_the_process_on_cancel(app, tmp_path):
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\nwhile true; do echo progress=continue; sleep 0.05; done\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    cancel = threading.Event()
+    blocks = []
+    threading.Timer(0.3, cancel.set).start()
+
+    started = time.monotonic()
+    code = app._run_ffmpeg([str(script)], deque(maxlen=5), blocks.append, cancel)
+    assert code != 0
+    assert blocks
+    assert time.monotonic() - started < 3
+
+
+def probe(video_kbps=2900, audio_kbps=128, audio_codec="aac", codec="h264", size_mb=225,
+          width=1920, height=1080, fps="30/1"):
+    """ffprobe-style dict; the duration follows from the size and bitrates."""
+    duration = size_mb * 8000 / (video_kbps + audio_kbps)
+    streams = [{"codec_type": "video", "codec_name": codec, "width": width, "height": height,
+                "r_frame_rate": fps, "avg_frame_rate": fps, "bit_rate": str(video_kbps * 1000)}]
+    if audio_codec:
+        streams.append({"codec_type": "audio", "codec_name": audio_codec, "bit_rate": str(audio_kbps * 1000)})
+    return {"format": {"duration": str(duration), "size": str(size_mb * 1_000_000),
+                       "bit_rate": str((video_kbps + audio_kbps) * 1000)},
+            "streams": streams}
+
+
+@pytest.mark.parametrize("mode, quality, target_mb", [("size", 70, 50), ("vbr", 30, None)])
+def test_plan_honours_an_explicit_target_over_efficient_sources(app, mode, quality, target_mb):
+    # 225 MB of 1080p30 at 2.9 Mb/s is "efficient" by bits per pixel, but the user asked for less
+    plan = app.plan_video(probe(), mode, quality, target_mb)
+    assert plan["action"] == "full"
+    assert plan["estimated_mb"] < 100
+
+
+def test_plan_keeps_efficient_video_in_crf_mode(app):
+    # At quality 0 the rough crf estimate is far below 2.9 Mb/s; bits per pixel still keep it
+    plan = app.plan_video(probe(), "crf", 0)
+    assert plan["action"] == "audio"   # 128 kb/s AAC is above VIDEO_AUDIO_COPY_KBPS
+    assert "bits/pixel" in plan["reason"]
+
+
+def test_plan_size_mode_counts_audio_against_the_budget(app):
+    # 40 MB over 320 s is 1000 kb/s: 950 kb/s of video fits on its own, not with 96 kb/s of audio
+    info = probe(video_kbps=950, audio_kbps=96, size_mb=41.84)
+    assert app.probe_duration(info) == pytest.approx(320, abs=0.1)
+    assert app.plan_video(info, "size", target_mb=40)["action"] == "full"
+    assert app.plan_video(info, "size", target_mb=42)["action"] == "remux"
+
+
+def test_plan_vbr_has_no_margin_over_the_target(app):
+    info = probe(video_kbps=1000, audio_kbps=0, audio_codec=None, size_mb=100)
+    # vbr targets quality% of the overall source bitrate: 99% is 990 kb/s
+    assert app.plan_video(info, "vbr", 99)["action"] == "full"
+    assert app.plan_video(info, "vbr", 100)["action"] == "remux"
+
+
+def test_plan_converts_other_codecs(app):
+    plan = app.plan_video(probe(codec="mpeg4"), "crf", 70)
+    assert plan["action"] == "full"
+    assert "converted to h264" in plan["reason"]
+
+
+@pytest.fixture
+def ffmpeg_path(app, monkeypatch):
+    monkeypatch.setattr(app, "FFMPEG_PATH", "ffmpeg")
+    monkeypatch.setattr(app, "VIDEO_THREADS", 4)
+
+
+def test_crf_command(app, ffmpeg_path):
+    passes, details = app.build_video_passes("in.mp4", "out.mp4", probe(width=1280, height=720), "crf", 70)
+    assert passes == [["ffmpeg", "-i", "in.mp4", "-c:v", "libx264", "-preset", "medium", "-threads", "4",
+                       "-crf", "23", "-c:a", "aac", "-b:a", f"{app.VIDEO_AUDIO_KBPS}k",
+                       "-movflags", "+faststart", "-y", "out.mp4"]]
+    assert details == {"mode": "crf", "preset": "medium", "threads": 4, "crf": 23}
+
+
+def test_crf_maps_quality_onto_35_to_18(app):
+    assert [app._crf(q) for q in (0, 50, 100)] == [35, 26, 18]
+
+
+def test_vbr_command(app, ffmpeg_path):
+    info = probe(video_kbps=2872, audio_kbps=128, width=1280, height=720)   # 3000 kb/s overall
+    passes, details = app.build_video_passes("in.mp4", "out.mp4", info, "vbr", 50, speed="fast")
+    assert passes == [["ffmpeg", "-i", "in.mp4", "-c:v", "libx264", "-preset", "faster", "-threads", "4",
+                       "-b:v", "1500k", "-maxrate", "2250k", "-bufsize", "3000k",
+                       "-c:a", "aac", "-b:a", f"{app.VIDEO_AUDIO_KBPS}k",
+                       "-movflags", "+faststart", "-y", "out.mp4"]]
+    assert details == {"mode": "vbr", "preset": "faster", "threads": 4, "video_kbps": 1500}
+
+
+def test_vbr_has_a_floor(app):
+    assert app.video_target_kbps(probe(video_kbps=400, audio_kbps=0, audio_codec=None), "vbr", 10) == 300
+
+
+def test_size_mode_is_two_pass(app, ffmpeg_path):
+    info = probe(width=1280, height=720)
+    duration = app.probe_duration(info)
+    passes, details = app.build_video_passes("in.mp4", "out.mp4", info, "size", target_mb=50, passlog="/tmp/log",
+                                             audio=False, threads=2)
+    kbps = int(50 * 8000 * 0.96 / duration) - app.VIDEO_AUDIO_KBPS
+    rate = ["-b:v", f"{kbps}k", "-passlogfile", "/tmp/log"]
+    head = ["ffmpeg", "-i", "in.mp4", "-c:v", "libx264", "-preset", "medium", "-threads", "2"]
+    assert passes == [head + rate + ["-pass", "1", "-an", "-f", "null", "-y", os.devnull],
+                      head + rate + ["-pass", "2", "-an", "-movflags", "+faststart", "-y", "out.mp4"]]
+    assert details == {"mode": "size", "preset": "medium", "threads": 2, "target_mb": 50, "video_kbps": kbps}
+
+
+def test_size_mode_needs_a_duration(app):
+    info = probe()
+    del info["format"]["duration"]
+    with pytest.raises(ValueError):
+        app.video_target_kbps(info, "size", target_mb=10)
+
+
+@pytest.mark.parametrize("speed, size, preset", [
+    ("balanced", (1920, 1080), "medium"),
+    ("balanced", (3840, 2160), "fast"),      # above VIDEO_HIGH_PIXEL_RATE: one step faster
+    ("quality", (1280, 720), "slow"),
+    ("fastest", (3840, 2160), "superfast"),
+    ("unknown", (1280, 720), "medium"),
+])
+def test_x264_preset_selection(app, speed, size, preset):
+    assert app.x264_preset(speed, probe(width=size[0], height=size[1])) == preset
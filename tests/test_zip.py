@@ -0,0 +1,105 @@
+import os
+import zipfile
+from io import BytesIO
+
+import pytest
+
+
+def payload(size):
+    # Compressible but not trivially so: text with some variety per line
+    return b"".join(b"line %d of the zip payload\n" % i for i in range(size // 24))[:size]
+
+
+@pytest.mark.parametrize("level", [0, 6, 9])
+def test_parallel_deflate_round_trip(app, monkeypatch, level):
+    monkeypatch.setattr(app, "ZIP_DEFLATE_BLOCK", 4096)
+    data = {"a.txt": payload(50_000), "b.bin": os.urandom(10_000), "empty.txt": b""}
+    members = [(name, BytesIO(body)) for name, body in data.items()]
+
+    out = b"".join(app.stream_zip(members, zipfile.ZIP_DEFLATED, level, workers=3))
+    with zipfile.ZipFile(BytesIO(out)) as z:
+        assert z.testzip() is None
+        assert {name: z.read(name) for name in z.namelist()} == data
+        assert all(info.flag_bits & 0x08 for info in z.infolist())
+
+
+def test_parallel_deflate_falls_back_without_zipfile_internals(app, monkeypatch):
+    monkeypatch.setattr(app, "ZIP_RAW_WRITES", False)
+    called = []
+    monkeypatch.setattr(app, "_write_deflated_parallel", lambda *a: called.append(a))
+    out = b"".join(app.stream_zip([("a.txt", BytesIO(payload(20_000)))], workers=3))
+    with zipfile.ZipFile(BytesIO(out)) as z:
+        assert z.read("a.txt") == payload(20_000)
+    assert not called
+
+
+def test_create_zip_level_zero_is_not_the_preset_default(app, client):
+    body = payload(100_000)
+    r = client.post("/create_zip", data={"file": (BytesIO(body), "notes.txt"), "level": "0"})
+    with zipfile.ZipFile(BytesIO(r.data)) as z:
+        info = z.getinfo("notes.txt")
+        assert z.read(info) == body
+        assert info.compress_size >= len(body)   # level 0: deflate stored blocks
+
+
+@pytest.mark.parametrize("preset, level", [("balanced", 15), ("bzip2", 0), ("smallest", 5)])
+def test_create_zip_rejects_bad_levels_before_streaming(app, client, preset, level):
+    r = client.post("/create_zip", data={"file": (BytesIO(b"hello"), "a.txt"),
+                                         "preset": preset, "level": str(level)})
+    assert r.mimetype == "text/html"
+    assert b"alert" in r.data
+    assert f'<option value="{preset}" selected>'.encode() in r.data
+
+
+def test_create_zip_form_lists_presets(app, client):
+    html = client.get("/create_zip").data.decode()
+    for name in app.ZIP_PRESETS:
+        assert f'<option value="{name}"' in html
+    assert f'<option value="{app.ZIP_DEFAULT_PRESET}" selected>' in html
+
+
+def test_small_members_are_deflated_concurrently(app, monkeypatch):
+    import threading
+    import time
+
+    lock = threading.Lock()
+    running, peak = [0], [0]
+    deflate = app._deflate_block
+
+    def slow_deflate(*args):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return deflate(*args)
+
+    monkeypatch.setattr(app, "_deflate_block", slow_deflate)
+    # Every member is well under one block
+    data = {f"logs/{i:02d}.csv": payload(1000 + 37 * i) for i in range(24)}
+    members = [(name, BytesIO(body)) for name, body in data.items()]
+
+    out = b"".join(app.stream_zip(members, zipfile.ZIP_DEFLATED, 6, workers=4))
+    with zipfile.ZipFile(BytesIO(out)) as z:
+        assert z.testzip() is None
+        assert z.namelist() == list(data)
+        assert {name: z.read(name) for name in z.namelist()} == data
+    assert peak[0] > 1
+
+
+def test_mixed_member_sizes_keep_their_order(app, monkeypatch):
+    monkeypatch.setattr(app, "ZIP_DEFLATE_BLOCK", 4096)
+    data = {"a.csv": payload(500), "big.log": payload(3 * 4096 + 100), "b.csv": payload(4096),
+            "stored.bin": os.urandom(300), "c.csv": b""}
+    members = []
+    for name, body in data.items():
+        zinfo = zipfile.ZipInfo(name, (2024, 1, 1, 0, 0, 0))
+        zinfo.compress_type = zipfile.ZIP_STORED if name.endswith(".bin") else zipfile.ZIP_DEFLATED
+        members.append((zinfo, BytesIO(body)))
+
+    out = b"".join(app.stream_zip(members, zipfile.ZIP_DEFLATED, 9, workers=3))
+    with zipfile.ZipFile(BytesIO(out)) as z:
+        assert z.testzip() is None
+        assert z.namelist() == list(data)
+        assert {name: z.read(name) for name in z.namelist()} == data